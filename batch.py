@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from unit_builder import NOT_DIAGONAL_UNITS, ALL_UNITS, unit_index
+from solution import solve
+from instrumentation import SolveStats, aggregate
+from puzzle_io import Puzzle, PuzzleWriter, read_puzzles, read_range, split_ranges
+
+
+class BatchResult(NamedTuple):
+    index: int
+    puzzle: str
+    solution: Optional[str]
+    seconds: float
+    error: Optional[str]
+    stats: Optional[dict] = None
+
+
+Chunk = Tuple[int, List[str]]
+
+_USE_DIAGONAL = False
+_COLLECT_STATS = False
+
+
+def _init_worker(use_diagonal: bool, collect_stats=False):
+    """Runs once per worker process: builds the unit tables before the first puzzle arrives"""
+    global _USE_DIAGONAL, _COLLECT_STATS
+    _USE_DIAGONAL = use_diagonal
+    _COLLECT_STATS = collect_stats
+    unit_index(ALL_UNITS if use_diagonal else NOT_DIAGONAL_UNITS)
+
+
+def solve_one(index: int, puzzle: str, use_diagonal: bool, collect_stats=False) -> BatchResult:
+    """Solves a single puzzle, reporting the time spent and why it failed, if it did"""
+    stats = SolveStats() if collect_stats else None
+    start = time.perf_counter()
+    try:
+        game = solve(puzzle, use_diagonal=use_diagonal, stats=stats)
+        solution, error = (str(game), None) if game else (None, 'unsolvable')
+    except Exception as e:
+        solution, error = None, repr(e)
+    return BatchResult(index, puzzle, solution, time.perf_counter() - start, error,
+                       stats.as_dict() if stats is not None else None)
+
+
+def _solve_chunk(chunk: Chunk) -> List[BatchResult]:
+    start, puzzles = chunk
+    return [solve_one(start + i, puzzle, _USE_DIAGONAL, _COLLECT_STATS) for i, puzzle in enumerate(puzzles)]
+
+
+def aggregate_stats(results: Iterable[BatchResult]) -> SolveStats:
+    """The sum of the stats of every result that collected them"""
+    return aggregate(SolveStats.from_dict(r.stats) for r in results if r.stats is not None)
+
+
+def _chunks(puzzles: Iterable[str], chunksize: int) -> Iterator[Chunk]:
+    puzzles = iter(puzzles)
+    start = 0
+    while True:
+        chunk = list(islice(puzzles, chunksize))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+
+def solve_batch(puzzles: Iterable[str], use_diagonal=False, workers: Optional[int] = None, chunksize=64,
+                ordered=True, collect_stats=False) -> Iterator[BatchResult]:
+    """
+    Solve many puzzles across a pool of worker processes.
+    Args:
+        puzzles: any iterable of grid strings, it is consumed lazily
+        use_diagonal: If true it will enforce a diagonal sudoku
+        workers: number of processes, None for one per core and 0 to solve in the calling process
+        chunksize: number of puzzles sent to a worker at a time
+        ordered: If true the results are yielded in input order, otherwise as soon as every chunk finishes
+        collect_stats: If true every result carries the SolveStats of its solve as a dictionary
+    Returns:
+        An iterator of BatchResult, one per puzzle
+    """
+    if workers == 0:
+        for i, puzzle in enumerate(puzzles):
+            yield solve_one(i, puzzle, use_diagonal, collect_stats)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(use_diagonal, collect_stats)) as pool:
+        chunks = _chunks(puzzles, chunksize)
+        max_in_flight = 2 * workers
+        in_flight = {}
+        done_chunks = {}
+        next_chunk = 0
+        exhausted = False
+        while in_flight or not exhausted:
+            while not exhausted and len(in_flight) + len(done_chunks) < max_in_flight:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                else:
+                    in_flight[pool.submit(_solve_chunk, chunk)] = chunk[0]
+            if not in_flight:
+                break
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                start = in_flight.pop(future)
+                if not ordered:
+                    yield from future.result()
+                else:
+                    done_chunks[start] = future.result()
+            while next_chunk in done_chunks:
+                results = done_chunks.pop(next_chunk)
+                next_chunk += len(results)
+                yield from results
+
+
+def _solve_range(file_range: Tuple[str, int, int]) -> List[Tuple[Puzzle, BatchResult]]:
+    path, start, end = file_range
+    return [(puzzle, solve_one(i, puzzle.grid, _USE_DIAGONAL, _COLLECT_STATS))
+            for i, puzzle in enumerate(read_range(path, start, end))]
+
+
+def solve_file(path: str, use_diagonal=False, workers: Optional[int] = None, parts: Optional[int] = None,
+               collect_stats=False) -> Iterator[Tuple[Puzzle, BatchResult]]:
+    """
+    Solve a puzzle file without sending the puzzles to the workers: the file is split in byte ranges
+    and every worker memory maps the same file and reads its own ranges.
+    Args:
+        path: puzzle file in any of the layouts read by puzzle_io
+        use_diagonal: If true it will enforce a diagonal sudoku
+        workers: number of processes, None for one per core
+        parts: number of byte ranges, by default eight per worker
+        collect_stats: If true every result carries the SolveStats of its solve as a dictionary
+    Returns:
+        An iterator of (Puzzle, BatchResult) in file order
+    """
+    workers = workers or os.cpu_count() or 1
+    ranges = [(path, start, end) for start, end in split_ranges(path, parts or 8 * workers)]
+    index = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(use_diagonal, collect_stats)) as pool:
+        for results in pool.map(_solve_range, ranges):
+            for puzzle, result in results:
+                yield puzzle, result._replace(index=index)
+                index += 1
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Solve a file of sudoku puzzles, one per line')
+    parser.add_argument('puzzles', help="puzzle file, '-' for standard input")
+    parser.add_argument('--diagonal', action='store_true', help='enforce the diagonal units')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, 0 solves in process')
+    parser.add_argument('--chunksize', type=int, default=64)
+    parser.add_argument('--unordered', action='store_true', help='write results as soon as they are ready')
+    parser.add_argument('--mmap', action='store_true', help='let every worker read byte ranges of the file')
+    parser.add_argument('--output', help='write the solutions to this file in the layout of the puzzle file')
+    parser.add_argument('--stats', choices=['json', 'prometheus'],
+                        help='write the search and strategy counters of the whole batch to standard error')
+    args = parser.parse_args(argv)
+
+    collect_stats = args.stats is not None
+    if args.mmap:
+        results = solve_file(args.puzzles, args.diagonal, args.workers, collect_stats=collect_stats)
+    else:
+        source = sys.stdin.buffer if args.puzzles == '-' else args.puzzles
+        reading = {}
+
+        def grids() -> Iterator[str]:
+            for i, puzzle in enumerate(read_puzzles(source)):
+                reading[i] = puzzle
+                yield puzzle.grid
+
+        results = ((reading.pop(result.index), result)
+                   for result in solve_batch(grids(), args.diagonal, args.workers, args.chunksize,
+                                             not args.unordered, collect_stats))
+
+    writer = PuzzleWriter(args.output) if args.output else None
+    stats = SolveStats()
+    solved = failed = 0
+    start = time.perf_counter()
+    for puzzle, result in results:
+        print(result.index, result.solution or '-', '%.6f' % result.seconds, result.error or '', sep='\t')
+        if writer:
+            writer.write(puzzle, result.solution or puzzle.grid)
+        if result.stats is not None:
+            stats.merge(SolveStats.from_dict(result.stats))
+        if result.error:
+            failed += 1
+        else:
+            solved += 1
+    if writer:
+        writer.close()
+    elapsed = time.perf_counter() - start
+    print('solved %d, failed %d in %.3fs (%.1f puzzles/s)' % (solved, failed, elapsed,
+                                                              (solved + failed) / elapsed if elapsed else 0),
+          file=sys.stderr)
+    if args.stats == 'json':
+        print(json.dumps(stats.as_dict(), indent=2, sort_keys=True), file=sys.stderr)
+    elif args.stats == 'prometheus':
+        print(stats.to_prometheus(), end='', file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
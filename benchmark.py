@@ -0,0 +1,254 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+from solution import solve
+from unit_builder import Backend, Branching, ValueOrder
+from instrumentation import SolveStats
+from strategies import CONSTRAINTS, ADVANCED
+
+CORPORA: Dict[str, List[str]] = {
+    'easy': [
+        "..3.2.6..9..3.5..1..18.64....81.29..7.......8..67.82....26.95..8..2.3..9..5.1.3..",
+        "2...8.3...6..7..84.3.5..2.9...1.54.8.........4.27.6...3.1..7.4.72..4..6...4.1...3",
+        "......9.7...42.18....7.5.261..9.4....5.....4....5.7..992.1.8....34.59...5.7......",
+        ".3..5..4...8.1.5..46.....12.7.5.2.8....6.3....4.1.9.3.25.....98..1.2.6...8..6..2.",
+        ".2.81.74.7....31...9...28.5..9.4..874..2.8..316..3.2..3.27...6...56....8.76.51.9.",
+        "48...69.2..2..8..19..37..6.84..1.2....37.41....1.6..49.2..85..77..9..6..6.92...18",
+    ],
+    'hard': [
+        "8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..",
+        "85...24..72......9..4.........1.7..23.5...9...4...........8..7..17..........36.4.",
+        "..53.....8......2..7..1.5..4....53...1..7...6..32...8..6.5....9..4....3......97..",
+        "...57..3.1......2.7...234......8...4..7..4...49....6.5.42...3.....7..9....18.....",
+        "1....7.9..3..2...8..96..5....53..9...1..8...26....4...3......1..4......7..7...3..",
+        ".9...4..7.....79..8........4.58.....3.......2.....97.6........4..35.....2..6...8.",
+    ],
+    'minimal': [
+        "4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......",
+        "52...6.........7.13...........4..8..6......5...........418.........3..2...87.....",
+        "6.....8.3.4.7.................5.4.7.3..2.....1.6.......2.....5.....8.6......1....",
+        "48.3............71.2.......7.5....6....2..8.............1.76...3.....4......5....",
+        "....14....3....2...7..........9...3.6.1.............8.2.....1.4....5.6.....7.8...",
+        ".......1.4.........2...........5.4.7..8...3....1.9....3..4..2...5.1........8.6...",
+    ],
+    'diagonal': [
+        "2.............62....1....7...6..8...3...9...7...6..4...4....8....52.............3",
+        "...94.3818.37......9.......5..4....23....2....2...7.38.4........3...1.6.7..5.....",
+        ".....538....71.2.94....3....7......238.19....1....7..8..........3....7.4.18.6..23",
+        "....4..81.5.......4..8.3..6.7..38.....4.9.....2.......6.2.79...93...176.7..5649..",
+    ],
+    'unsolvable': [
+        "11...............................................................................",
+        "..53.....8....7.2..7..1.5..4....53...1..7...6..32...8..6.5....9..4....3......97..",
+        "...57..3.1......2.7...234......8...4..7..4...49....6.5.42...3.....7..9....18...4.",
+        "4.....8.5.3..........7.8....2.....6.....8.4......1.......6.3.7.5..2.....1.4......",
+    ],
+}
+
+CASES: List[Tuple[str, bool]] = [('easy', False), ('hard', False), ('minimal', False), ('unsolvable', False),
+                                 ('diagonal', False), ('diagonal', True)]
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def run_case(puzzles: List[str], use_diagonal: bool, repeat=3, backend=Backend.PROPAGATE) -> Dict[str, float]:
+    """Solves the puzzles once to warm up, repeat times measured, then once more under tracemalloc
+       to measure the peak memory"""
+    for puzzle in puzzles:
+        solve(puzzle, use_diagonal, backend=backend)
+    latencies = []
+    stats = SolveStats()
+    solved = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for puzzle in puzzles:
+            t = time.perf_counter()
+            game = solve(puzzle, use_diagonal, stats=stats, backend=backend)
+            latencies.append(time.perf_counter() - t)
+            solved += game is not None
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for puzzle in puzzles:
+        solve(puzzle, use_diagonal, backend=backend)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    runs = repeat * len(puzzles)
+    return {'puzzles': len(puzzles),
+            'solved': solved // repeat,
+            'puzzles_per_second': runs / elapsed,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'nodes_per_puzzle': stats.nodes / runs,
+            'backtracks_per_puzzle': stats.backtracks / runs,
+            'max_depth': stats.max_depth,
+            'propagations_per_puzzle': stats.propagations / runs,
+            'peak_memory_kb': peak / 1024}
+
+
+def run(cases: List[Tuple[str, bool]] = CASES, repeat=3, backend=Backend.PROPAGATE) -> Dict:
+    results = {}
+    for corpus, use_diagonal in cases:
+        name = '%s/%s' % (corpus, 'diagonal' if use_diagonal else 'standard')
+        results[name] = run_case(CORPORA[corpus], use_diagonal, repeat, backend)
+    return {'meta': _meta(repeat, backend=backend.name), 'results': results}
+
+
+def _meta(repeat: int, **extra) -> Dict:
+    meta = {'python': platform.python_version(), 'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'repeat': repeat}
+    meta.update(extra)
+    return meta
+
+
+def compare_strategies(puzzles: List[str], use_diagonal: bool, repeat=1) -> Dict[str, Dict[str, float]]:
+    """Solves the puzzles with CONSTRAINTS alone ('baseline'), with each ADVANCED strategy added and with all of
+       them ('all'), reporting how much each one shrinks the search tree against the time spent in it"""
+    variants = [('baseline', CONSTRAINTS)] + [(s.__name__, CONSTRAINTS + [s]) for s in ADVANCED]
+    variants.append(('all', CONSTRAINTS + ADVANCED))
+    advanced = {s.__name__ for s in ADVANCED}
+    report = {}
+    for name, strategies in variants:
+        for puzzle in puzzles:
+            solve(puzzle, use_diagonal, strategies=strategies)
+        stats = SolveStats()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for puzzle in puzzles:
+                solve(puzzle, use_diagonal, stats=stats, strategies=strategies)
+        elapsed = time.perf_counter() - start
+        runs = repeat * len(puzzles)
+        own = sum(seconds for strategy, seconds in stats.strategy_seconds.items() if strategy in advanced)
+        report[name] = {'nodes_per_puzzle': stats.nodes / runs,
+                        'ms_per_puzzle': elapsed / runs * 1000,
+                        'strategy_ms_per_puzzle': own / runs * 1000}
+    base = report['baseline']
+    for metrics in report.values():
+        metrics['node_reduction'] = 1 - metrics['nodes_per_puzzle'] / base['nodes_per_puzzle']
+        metrics['speedup'] = base['ms_per_puzzle'] / metrics['ms_per_puzzle']
+    return report
+
+
+def run_strategies(cases: List[Tuple[str, bool]] = CASES, repeat=1) -> Dict:
+    results = {}
+    for corpus, use_diagonal in cases:
+        name = '%s/%s' % (corpus, 'diagonal' if use_diagonal else 'standard')
+        results[name] = compare_strategies(CORPORA[corpus], use_diagonal, repeat)
+    return {'meta': _meta(repeat), 'strategies': results}
+
+
+# name: (solve arguments, True when the policy is random and is measured over several seeds)
+POLICIES: Dict[str, Tuple[Dict, bool]] = {
+    'mrv': ({}, False),
+    'mrv_degree': ({'branching': Branching.MRV_DEGREE}, False),
+    'least_constraining': ({'value_order': ValueOrder.LEAST_CONSTRAINING}, False),
+    'mrv_degree_least_constraining': ({'branching': Branching.MRV_DEGREE,
+                                       'value_order': ValueOrder.LEAST_CONSTRAINING}, False),
+    'random': ({}, True),
+    'random_restarts': ({'restarts': 8}, True),
+}
+
+
+def compare_branching(puzzles: List[str], use_diagonal: bool, seeds=5) -> Dict[str, Dict[str, float]]:
+    """Solves the puzzles with every branching policy, the random ones once per seed. The spread of the
+       nodes per puzzle across seeds shows how much the latency depends on the choices of the search"""
+    report = {}
+    for name, (kwargs, randomized) in POLICIES.items():
+        samples = []
+        latencies = []
+        for seed in (range(seeds) if randomized else [None]):
+            stats = SolveStats()
+            for puzzle in puzzles:
+                t = time.perf_counter()
+                solve(puzzle, use_diagonal, stats=stats, seed=seed, **kwargs)
+                latencies.append(time.perf_counter() - t)
+            samples.append(stats.nodes / len(puzzles))
+        report[name] = {'nodes_per_puzzle': sum(samples) / len(samples),
+                        'nodes_per_puzzle_min': min(samples),
+                        'nodes_per_puzzle_max': max(samples),
+                        'p50_ms': percentile(latencies, 0.50) * 1000,
+                        'p99_ms': percentile(latencies, 0.99) * 1000}
+    return report
+
+
+def run_branching(cases: List[Tuple[str, bool]] = CASES, seeds=5) -> Dict:
+    results = {}
+    for corpus, use_diagonal in cases:
+        name = '%s/%s' % (corpus, 'diagonal' if use_diagonal else 'standard')
+        results[name] = compare_branching(CORPORA[corpus], use_diagonal, seeds)
+    return {'meta': _meta(1, seeds=seeds), 'branching': results}
+
+
+# metric: True when a larger value is better
+COMPARED = {'puzzles_per_second': True, 'p50_ms': False, 'p99_ms': False, 'nodes_per_puzzle': False}
+
+
+def regressions(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Descriptions of every metric that got worse than the baseline by more than threshold (a fraction)"""
+    found = []
+    for name, metrics in current['results'].items():
+        before = baseline['results'].get(name)
+        if not before:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            old, new = before.get(metric), metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > threshold:
+                found.append('%s %s: %.4g -> %.4g (%+.1f%%)' % (name, metric, old, new, change * 100))
+    return found
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Measure the solver throughput and latency')
+    parser.add_argument('--output', help='write the results as JSON to this file instead of standard output')
+    parser.add_argument('--baseline', help='results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='allowed relative slowdown before failing, 0.10 by default')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--corpus', action='append', choices=sorted(CORPORA), help='only run these corpora')
+    parser.add_argument('--backend', choices=[b.name for b in Backend], default=Backend.PROPAGATE.name)
+    parser.add_argument('--strategies', action='store_true',
+                        help='report the search tree shrinkage and the cost of every advanced strategy instead')
+    parser.add_argument('--branching', action='store_true',
+                        help='report the search nodes and latency of every branching policy instead')
+    parser.add_argument('--seeds', type=int, default=5, help='seeds tried by the random branching policies')
+    args = parser.parse_args(argv)
+
+    cases = [case for case in CASES if not args.corpus or case[0] in args.corpus]
+    if args.strategies:
+        current = run_strategies(cases, args.repeat)
+        args.baseline = None
+    elif args.branching:
+        current = run_branching(cases, args.seeds)
+        args.baseline = None
+    else:
+        current = run(cases, args.repeat, Backend[args.backend])
+    text = json.dumps(current, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(current, json.load(f), args.threshold)
+        for line in found:
+            print('REGRESSION', line, file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
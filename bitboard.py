@@ -0,0 +1,138 @@
+import random
+from array import array
+from functools import lru_cache, reduce
+from operator import xor
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from unit_builder import Box, Values, Geometry, STANDARD, geometry
+
+Mask = int
+Cells = array
+
+# masks up to this many bits get their lookup tables filled up front, wider ones fill them on first use
+TABLE_BITS = 16
+
+
+class _LazyTable(dict):
+    """A lookup table too large to fill up front: entries are computed the first time they are read"""
+    def __init__(self, entry: Callable[[Mask], object]):
+        super().__init__()
+        self.entry = entry
+
+    def __missing__(self, mask: Mask):
+        value = self[mask] = self.entry(mask)
+        return value
+
+
+class MaskTables(object):
+    """Lookup tables of the candidate masks of a geometry, one bit per value:
+         popcount: the number of candidates of every mask
+         mask_values: the sorted values of every mask as a string
+         mask_bits: the single bit masks of every mask
+       The cells of a board are an array of cell_type, wide enough for the full mask"""
+    def __init__(self, layout: Geometry):
+        self.geometry = layout
+        self.boxes: List[Box] = layout.boxes
+        self.digits: str = layout.digits
+        self.full_mask: Mask = (1 << len(self.digits)) - 1
+        self.digit_mask: Dict[str, Mask] = {d: 1 << i for i, d in enumerate(self.digits)}
+        self.cell_type = 'H' if len(self.digits) <= 16 else 'L'
+        digits, digit_mask = self.digits, self.digit_mask
+
+        def values(m: Mask) -> str:
+            return "".join(d for d in digits if m & digit_mask[d])
+
+        if len(self.digits) <= TABLE_BITS:
+            masks = range(self.full_mask + 1)
+            self.popcount = tuple(bin(m).count('1') for m in masks)
+            self.mask_values = tuple(values(m) for m in masks)
+            self.mask_bits = tuple(tuple(digit_mask[d] for d in self.mask_values[m]) for m in masks)
+        else:
+            self.popcount = _LazyTable(lambda m: bin(m).count('1'))
+            self.mask_values = _LazyTable(values)
+            self.mask_bits = _LazyTable(lambda m: tuple(digit_mask[d] for d in values(m)))
+
+
+@lru_cache(maxsize=None)
+def mask_tables(n: int) -> MaskTables:
+    """Returns the (cached) mask tables of the boards with n*n by n*n boxes"""
+    return MaskTables(geometry(n))
+
+
+class ZobristKeys(object):
+    """Random 64 bit keys of every (box, value) pair for hashing the candidate state of a board: the hash is the
+       xor of the keys of the candidates removed from the full board, so removing candidates updates it with
+       one xor. box_keys[ix][mask] is the xor of the keys of the values in mask, filled on first use"""
+    def __init__(self, tables: MaskTables, seed=0):
+        rng = random.Random(seed)
+        mask_bits = tables.mask_bits
+        self.box_keys: List[_LazyTable] = []
+        for _ in tables.boxes:
+            keys = {bit: rng.getrandbits(64) for bit in mask_bits[tables.full_mask]}
+            self.box_keys.append(_LazyTable(lambda m, keys=keys: reduce(xor, (keys[b] for b in mask_bits[m]), 0)))
+
+    def hash(self, cells: Cells, full_mask: Mask) -> int:
+        """The hash of a whole board, kept up to date by the board afterwards"""
+        h = 0
+        for keys, m in zip(self.box_keys, cells):
+            h ^= keys[full_mask ^ m]
+        return h
+
+
+@lru_cache(maxsize=None)
+def zobrist_keys(n: int) -> ZobristKeys:
+    """Returns the (cached) Zobrist keys of the boards with n*n by n*n boxes, the same in every process"""
+    return ZobristKeys(mask_tables(n))
+
+
+STANDARD_TABLES: MaskTables = mask_tables(STANDARD.n)
+DIGITS: str = STANDARD_TABLES.digits
+FULL_MASK: Mask = STANDARD_TABLES.full_mask
+DIGIT_MASK = STANDARD_TABLES.digit_mask
+POPCOUNT: Tuple[int, ...] = STANDARD_TABLES.popcount
+MASK_VALUES: Tuple[str, ...] = STANDARD_TABLES.mask_values
+MASK_BITS: Tuple[Tuple[Mask, ...], ...] = STANDARD_TABLES.mask_bits
+CELL_TYPE = STANDARD_TABLES.cell_type
+
+
+def mask_of(values: Iterable[chr], tables: MaskTables = STANDARD_TABLES) -> Mask:
+    """Returns the bitmask with one bit set for every value"""
+    digit_mask = tables.digit_mask
+    mask = 0
+    for v in values:
+        mask |= digit_mask[v]
+    return mask
+
+
+def values_of(mask: Mask, tables: MaskTables = STANDARD_TABLES) -> Values:
+    """Returns the set of values encoded in a bitmask"""
+    return set(tables.mask_values[mask])
+
+
+def cells_from_string(grid: str, tables: MaskTables = STANDARD_TABLES) -> Cells:
+    """Builds the flat candidate buffer for a grid of one character per box, '.' or '0' are empty boxes"""
+    digit_mask, full = tables.digit_mask, tables.full_mask
+    return array(tables.cell_type, [digit_mask[c] if c in digit_mask else full for c in grid])
+
+
+def cells_from_board(board, tables: MaskTables = STANDARD_TABLES) -> Cells:
+    """Builds the flat candidate buffer from a Board (Dictionary of sets) or its string form"""
+    return array(tables.cell_type, [mask_of(board[box], tables) for box in tables.boxes])
+
+
+def board_from_cells(cells: Cells, tables: MaskTables = STANDARD_TABLES) -> dict:
+    """Expands the flat candidate buffer into a Board (Dictionary of sets)"""
+    mask_values = tables.mask_values
+    return {box: set(mask_values[m]) for box, m in zip(tables.boxes, cells)}
+
+
+def string_from_cells(cells: Cells, tables: MaskTables = STANDARD_TABLES) -> str:
+    """One character per box: the value if assigned, '.' if undecided and '*' if empty"""
+    popcount, mask_values = tables.popcount, tables.mask_values
+    return "".join(mask_values[m] if popcount[m] == 1 else '.' if m else '*' for m in cells)
+
+
+def snapshot_from_cells(cells: Cells, tables: MaskTables = STANDARD_TABLES) -> dict:
+    """The candidates of every box keyed by the box name, the form used by visualize_assignments"""
+    mask_values = tables.mask_values
+    return {r + c: mask_values[m] for (r, c), m in zip(tables.boxes, cells)}
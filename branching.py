@@ -0,0 +1,67 @@
+import random
+from typing import List, Optional, Sequence
+
+from unit_builder import Branching, ValueOrder
+from bitboard import Mask
+
+
+class Restart(Exception):
+    """Raised when the node budget of a policy runs out, the search starts again from the root"""
+
+
+class BranchingPolicy(object):
+    """How the search branches: which box to split and in which order to try its values.
+         box_order: MRV takes the box with the fewest candidates, MRV_DEGREE breaks the ties by the number
+                    of unassigned peers (the most constrained box first)
+         value_order: ASCENDING tries the values in order, LEAST_CONSTRAINING tries first the values
+                      found in the fewest unassigned peers
+         rng: when given the remaining ties are broken at random and the values shuffled before ordering,
+              otherwise ties go to the first box and the search is deterministic
+         node_budget: raise Restart after this many branching decisions
+    """
+    def __init__(self, box_order: Branching = Branching.MRV, value_order: ValueOrder = ValueOrder.ASCENDING,
+                 rng: Optional[random.Random] = None, node_budget: Optional[int] = None):
+        self.box_order = box_order
+        self.value_order = value_order
+        self.rng = rng
+        self.node_budget = node_budget
+        self.nodes = 0
+
+    def select(self, game) -> Optional[int]:
+        """Index of the box to branch on, None when every box is assigned"""
+        if self.node_budget is not None:
+            self.nodes += 1
+            if self.nodes > self.node_budget:
+                raise Restart()
+        if self.box_order == Branching.MRV and self.rng is None:
+            return game.cell_with_fewer_values()
+        cells = game.cells
+        popcount = game.masks.popcount
+        counts = [popcount[m] for m in cells]
+        fewest = min((count for count in counts if count > 1), default=None)
+        if fewest is None:
+            return None
+        tied = [ix for ix, count in enumerate(counts) if count == fewest]
+        if self.box_order == Branching.MRV_DEGREE and len(tied) > 1:
+            peers = game.index.cell_peers
+            degrees = [sum(1 for p in peers[ix] if counts[p] > 1) for ix in tied]
+            most = max(degrees)
+            tied = [ix for ix, degree in zip(tied, degrees) if degree == most]
+        return self.rng.choice(tied) if self.rng is not None else tied[0]
+
+    def values(self, game, ix: int) -> Sequence[Mask]:
+        """The candidates of a box as single bit masks, in the order they should be tried"""
+        values = game.masks.mask_bits[game.cells[ix]]
+        if self.rng is None and self.value_order == ValueOrder.ASCENDING:
+            return values
+        ordered: List[Mask] = list(values)
+        if self.rng is not None:
+            self.rng.shuffle(ordered)
+        if self.value_order == ValueOrder.LEAST_CONSTRAINING:
+            cells = game.cells
+            popcount = game.masks.popcount
+            open_peers = [cells[p] for p in game.index.cell_peers[ix] if popcount[cells[p]] > 1]
+            ordered.sort(key=lambda value: sum(1 for m in open_peers if m & value))
+        return ordered
+
+DEFAULT_POLICY = BranchingPolicy()
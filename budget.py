@@ -0,0 +1,53 @@
+import threading
+import time
+from typing import Optional
+
+from unit_builder import SolveStatus
+
+
+class CancellationToken(object):
+    """Cancels a running search from another thread, or from another process when it wraps a
+       multiprocessing.Event shared with it"""
+    def __init__(self, event=None):
+        self.event = event if event is not None else threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+
+class BudgetExceeded(Exception):
+    """Raised by the search when its budget runs out, status tells which limit was hit"""
+    def __init__(self, status: SolveStatus):
+        super().__init__(status.name)
+        self.status = status
+
+
+class Budget(object):
+    """Limits of a search, checked at every node:
+         deadline: a time.time() value, TIMEOUT once it has passed
+         max_nodes / max_depth: BUDGET_EXHAUSTED when the search needs more nodes or goes deeper
+         token: CANCELLED once the token is cancelled
+    """
+    def __init__(self, deadline: Optional[float] = None, max_nodes: Optional[int] = None,
+                 max_depth: Optional[int] = None, token: Optional[CancellationToken] = None):
+        self.deadline = deadline
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.token = token
+        self.nodes = 0
+
+    def charge(self, depth: int):
+        """Counts a search node at depth, raises BudgetExceeded if it goes over any limit"""
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise BudgetExceeded(SolveStatus.BUDGET_EXHAUSTED)
+        if self.max_depth is not None and depth > self.max_depth:
+            raise BudgetExceeded(SolveStatus.BUDGET_EXHAUSTED)
+        if self.deadline is not None and time.time() > self.deadline:
+            raise BudgetExceeded(SolveStatus.TIMEOUT)
+        if self.token is not None and self.token.cancelled:
+            raise BudgetExceeded(SolveStatus.CANCELLED)
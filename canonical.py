@@ -0,0 +1,184 @@
+from itertools import chain, groupby, permutations, product
+from operator import itemgetter
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from bitboard import DIGITS
+
+Order = Tuple[int, ...]
+SIZE = len(DIGITS)
+BAND = 3
+EMPTY = '.'
+
+
+class Transform(NamedTuple):
+    """A symmetry of the board: the grid is optionally transposed, then its rows and columns are reordered
+       (row r of the result is row rows[r] of the source) and its digits are renamed by relabel"""
+    transpose: bool
+    rows: Order
+    cols: Order
+    relabel: str
+
+
+def _transposed(grid: str) -> str:
+    return "".join(grid[c * SIZE + r] for r in range(SIZE) for c in range(SIZE))
+
+
+def _tied_orders(items: Sequence[int], key: Callable) -> List[Order]:
+    """All the orders of the items sorted by key that only differ inside groups of equal keys"""
+    groups = [list(g) for _, g in groupby(sorted(items, key=key), key)]
+    return [tuple(chain(*p)) for p in product(*[permutations(g) for g in groups])]
+
+
+def _line_orders(line_key: Sequence) -> List[Order]:
+    """Orders of the nine rows (or columns) that keep bands together, sorted by a symmetry invariant key"""
+    def band_key(b):
+        return tuple(sorted(line_key[BAND * b + i] for i in range(BAND)))
+
+    orders = []
+    for bands in _tied_orders(range(BAND), band_key):
+        inside = [_tied_orders(range(BAND * b, BAND * b + BAND), line_key.__getitem__) for b in bands]
+        orders.extend(tuple(chain(*p)) for p in product(*inside))
+    return orders
+
+
+def _invariant_keys(grid: str) -> Tuple[List, List]:
+    """A key per row and per column that does not change under the symmetries of the board"""
+    given = [[grid[r * SIZE + c] != EMPTY for c in range(SIZE)] for r in range(SIZE)]
+    row_count = [sum(given[r]) for r in range(SIZE)]
+    col_count = [sum(given[r][c] for r in range(SIZE)) for c in range(SIZE)]
+    row_key = [(row_count[r], tuple(sorted(col_count[c] for c in range(SIZE) if given[r][c])))
+               for r in range(SIZE)]
+    col_key = [(col_count[c], tuple(sorted(row_count[r] for r in range(SIZE) if given[r][c])))
+               for c in range(SIZE)]
+    return row_key, col_key
+
+
+def _commutes_with_reversal(order: Order) -> bool:
+    return all(order[SIZE - 1 - i] == SIZE - 1 - order[i] for i in range(SIZE))
+
+
+def _diagonal_symmetries() -> List[Tuple[bool, Order, Order]]:
+    """The symmetries that keep both diagonals: the same row and column order (or the column order
+       reversed) taken from the band preserving orders that commute with reversing the lines"""
+    reverse = tuple(range(SIZE - 1, -1, -1))
+    orders = [order for order in _line_orders([0] * SIZE) if _commutes_with_reversal(order)]
+    return [(transpose, rows, cols)
+            for transpose in (False, True)
+            for rows in orders
+            for cols in (rows, tuple(reverse[i] for i in rows))]
+
+
+DIAGONAL_SYMMETRIES: List[Tuple[bool, Order, Order]] = _diagonal_symmetries()
+
+
+def _col_getter(cols: Order) -> Callable:
+    return itemgetter(*[r * SIZE + c for r in range(SIZE) for c in cols])
+
+
+def _relabel_table(permuted: str) -> str:
+    """Digits in order of first appearance followed by the missing ones: relabel[k] becomes DIGITS[k]"""
+    seen = "".join(dict.fromkeys(permuted.replace(EMPTY, '')))
+    return seen + "".join(d for d in DIGITS if d not in seen)
+
+
+def _order_tree(orders: List[Order]) -> Dict:
+    """The orders as a prefix tree: the children of a node are keyed by the next line, leaves are empty"""
+    tree: Dict = {}
+    for order in orders:
+        node = tree
+        for line in order:
+            node = node.setdefault(line, {})
+    return tree
+
+
+def _relabel_line(line: str, labels: Dict[str, str]) -> Tuple[str, Dict[str, str]]:
+    """The line with its digits renamed by labels, a digit seen for the first time takes the next label.
+       labels is not changed, the extended labels are returned"""
+    out = []
+    extended = labels
+    for d in line:
+        if d != EMPTY:
+            label = extended.get(d)
+            if label is None:
+                if extended is labels:
+                    extended = dict(labels)
+                label = extended[d] = DIGITS[len(extended)]
+            d = label
+        out.append(d)
+    return "".join(out), extended
+
+
+def _smallest_standard(grid: str) -> Tuple[bool, Order, Order]:
+    """The symmetry giving the smallest relabeled grid. Every column order is searched with the rows fixed one
+       at a time, a row prefix larger than the same prefix of the best grid found is dropped with all of its
+       completions"""
+    best: List[Optional[str]] = [None]
+    best_symmetry: List[Optional[Tuple[bool, Order, Order]]] = [None]
+
+    def descend(node: Dict, lines: List[str], prefix: str, labels: Dict[str, str], order: Order, transpose: bool,
+                cols: Order):
+        if not node:
+            if best[0] is None or prefix < best[0]:
+                best[0], best_symmetry[0] = prefix, (transpose, order, cols)
+            return
+        for r, child in node.items():
+            line, extended = _relabel_line(lines[r], labels)
+            candidate = prefix + line
+            if best[0] is not None and candidate > best[0][:len(candidate)]:
+                continue
+            descend(child, lines, candidate, extended, order + (r,), transpose, cols)
+
+    for transpose in (False, True):
+        source = _transposed(grid) if transpose else grid
+        row_key, col_key = _invariant_keys(source)
+        tree = _order_tree(_line_orders(row_key))
+        for cols in _line_orders(col_key):
+            permuted = "".join(_col_getter(cols)(source))
+            lines = [permuted[r * SIZE:(r + 1) * SIZE] for r in range(SIZE)]
+            descend(tree, lines, '', {}, (), transpose, cols)
+    return best_symmetry[0]
+
+
+def apply_transform(grid: str, transform: Transform) -> str:
+    source = _transposed(grid) if transform.transpose else grid
+    rows = "".join(source[r * SIZE:(r + 1) * SIZE] for r in transform.rows)
+    permuted = "".join(_col_getter(transform.cols)(rows))
+    return permuted.translate(str.maketrans(transform.relabel, DIGITS))
+
+
+def invert_transform(grid: str, transform: Transform) -> str:
+    """Maps a grid in canonical orientation back to the orientation of the transformed grid"""
+    grid = grid.translate(str.maketrans(DIGITS, transform.relabel))
+    source = [EMPTY] * (SIZE * SIZE)
+    for r, row in enumerate(transform.rows):
+        for c, col in enumerate(transform.cols):
+            source[row * SIZE + col] = grid[r * SIZE + c]
+    source = "".join(source)
+    return _transposed(source) if transform.transpose else source
+
+
+def canonical_form(grid: str, use_diagonal=False) -> Tuple[str, Transform]:
+    """
+    The smallest grid reachable through the symmetries of the board, digits are renamed in order of
+    first appearance. Equivalent puzzles share their canonical form.
+    Args:
+        grid(string): a string representing a sudoku grid, '.' for empty boxes
+        use_diagonal: If true only the symmetries that keep the diagonals are used
+    Returns:
+        The canonical grid and the transform that maps grid to it
+    """
+    grid = grid.replace('0', EMPTY)
+    best = None
+    getters = {}
+    candidates = DIAGONAL_SYMMETRIES if use_diagonal else [_smallest_standard(grid)]
+    transposed = _transposed(grid)
+    for transpose, rows, cols in candidates:
+        source = transposed if transpose else grid
+        by_rows = "".join(source[r * SIZE:(r + 1) * SIZE] for r in rows)
+        getter = getters.get(cols) or getters.setdefault(cols, _col_getter(cols))
+        permuted = "".join(getter(by_rows))
+        relabel = _relabel_table(permuted)
+        candidate = permuted.translate(str.maketrans(relabel, DIGITS))
+        if best is None or candidate < best[0]:
+            best = (candidate, Transform(transpose, rows, cols, relabel))
+    return best
@@ -0,0 +1,175 @@
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from unit_builder import Unit, UnitIndex, unit_index
+from budget import Budget
+
+
+class DancingLinks(object):
+    """Exact cover matrix of a unit configuration as Knuth's dancing links: one column per box (it holds one
+       value) and one per (unit, value) (the value appears once in the unit), one row per (box, value).
+       Node 0 is the root, nodes 1..columns are the column headers and the rest are the matrix ones.
+       The links only depend on the units, every solve works on copies of them"""
+    def __init__(self, index: UnitIndex):
+        n_boxes = len(index.geometry.boxes)
+        n_values = index.geometry.size
+        n_columns = n_boxes + len(index.unit_cells) * n_values
+        self.L = list(range(-1, n_columns))
+        self.R = list(range(1, n_columns + 2))
+        self.L[0], self.R[n_columns] = n_columns, 0
+        self.U = list(range(n_columns + 1))
+        self.D = list(range(n_columns + 1))
+        self.C = list(range(n_columns + 1))
+        self.S = [0] * (n_columns + 1)
+        self.row_of: List[Tuple[int, int]] = [(-1, -1)] * (n_columns + 1)
+        self.first_node: List[List[int]] = []
+        for ix in range(n_boxes):
+            nodes = []
+            for v in range(n_values):
+                columns = [1 + ix] + [1 + n_boxes + u * n_values + v for u in index.cell_units[ix]]
+                first = len(self.C)
+                for k, column in enumerate(columns):
+                    node = len(self.C)
+                    self.C.append(column)
+                    self.L.append(node - 1 if k else first + len(columns) - 1)
+                    self.R.append(node + 1 if k < len(columns) - 1 else first)
+                    self.U.append(self.U[column])
+                    self.D.append(column)
+                    self.D[self.U[column]] = node
+                    self.U[column] = node
+                    self.S[column] += 1
+                    self.row_of.append((ix, v))
+                nodes.append(first)
+            self.first_node.append(nodes)
+
+    def links(self) -> Tuple[List[int], ...]:
+        return self.L[:], self.R[:], self.U[:], self.D[:], self.S[:]
+
+
+@lru_cache(maxsize=None)
+def _dancing_links(index: UnitIndex) -> DancingLinks:
+    return DancingLinks(index)
+
+
+class _Solver(object):
+    def __init__(self, matrix: DancingLinks, stats=None, budget: Optional[Budget] = None):
+        self.C = matrix.C
+        self.row_of = matrix.row_of
+        self.L, self.R, self.U, self.D, self.S = matrix.links()
+        self.stats = stats
+        self.budget = budget
+        self.solution: List[int] = []
+
+    def cover(self, c: int):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        L[R[c]] = L[c]
+        R[L[c]] = R[c]
+        i = D[c]
+        while i != c:
+            j = R[i]
+            while j != i:
+                U[D[j]] = U[j]
+                D[U[j]] = D[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    def uncover(self, c: int):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        i = U[c]
+        while i != c:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                U[D[j]] = j
+                D[U[j]] = j
+                j = L[j]
+            i = U[i]
+        L[R[c]] = c
+        R[L[c]] = c
+
+    def select(self, node: int) -> bool:
+        """Puts a row in the solution before the search, False if one of its columns is already covered"""
+        R, L, C = self.R, self.L, self.C
+        j = node
+        while True:
+            c = C[j]
+            if L[R[c]] != c:
+                return False
+            j = R[j]
+            if j == node:
+                break
+        j = node
+        while True:
+            self.cover(C[j])
+            j = R[j]
+            if j == node:
+                break
+        self.solution.append(node)
+        return True
+
+    def search(self, depth=0) -> bool:
+        """Algorithm X branching on the column with the fewest rows"""
+        R, D, S, C = self.R, self.D, self.S, self.C
+        if self.budget is not None:
+            self.budget.charge(depth)
+        if self.stats is not None:
+            self.stats.node(depth)
+        if R[0] == 0:
+            return True
+        c = R[0]
+        best, size = c, S[c]
+        while c and size > 1:
+            if S[c] < size:
+                best, size = c, S[c]
+            c = R[c]
+        if size == 0:
+            return False
+
+        self.cover(best)
+        r = D[best]
+        while r != best:
+            self.solution.append(r)
+            j = R[r]
+            while j != r:
+                self.cover(C[j])
+                j = R[j]
+            if self.search(depth + 1):
+                return True
+            j = self.L[r]
+            while j != r:
+                self.uncover(C[j])
+                j = self.L[j]
+            self.solution.pop()
+            if self.stats is not None:
+                self.stats.backtrack(depth)
+            r = D[r]
+        self.uncover(best)
+        return False
+
+
+def solve_exact_cover(grid: str, units: List[Unit], stats=None, budget: Optional[Budget] = None) -> Optional[str]:
+    """
+    Solve a grid as an exact cover problem with dancing links.
+    Args:
+        grid(string): a string representing a sudoku grid, '.' or '0' for empty boxes
+        units: the units of the sudoku, every unit must hold every value once
+        stats: optional SolveStats, the Algorithm X nodes and backtracks are added to it
+        budget: optional Budget charged at every Algorithm X node, BudgetExceeded propagates
+    Returns:
+        The solved grid as a string, None if no solution exists.
+    """
+    index = unit_index(units)
+    digits = index.geometry.digits
+    matrix = _dancing_links(index)
+    solver = _Solver(matrix, stats, budget)
+    for ix, c in enumerate(grid):
+        if c in digits and not solver.select(matrix.first_node[ix][digits.index(c)]):
+            return None
+    if not solver.search():
+        return None
+    solution = ['.'] * len(grid)
+    for node in solver.solution:
+        ix, v = matrix.row_of[node]
+        solution[ix] = digits[v]
+    return "".join(solution)
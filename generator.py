@@ -0,0 +1,150 @@
+import argparse
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from unit_builder import Unit, ValueResult, Propagation, ALL_BOXES, ALL_UNITS, NOT_DIAGONAL_UNITS, unit_index
+from bitboard import Cells, FULL_MASK, MASK_BITS, POPCOUNT, string_from_cells
+from strategies import CONSTRAINTS
+from instrumentation import SolveStats
+from solution import Sudoku, _explore, solve
+from transposition import TranspositionTable
+
+GRADES = ['easy', 'medium', 'hard', 'expert']
+
+
+class GeneratedPuzzle(NamedTuple):
+    grid: str
+    solution: str
+    clues: int
+    grade: str
+    strategies: List[str]
+    nodes: int
+    seed: Optional[int]
+
+
+def random_solution(rng: random.Random, units: List[Unit]) -> Cells:
+    """A random complete grid: depth first search on a single board trying the values in random order"""
+    game = Sudoku('.' * len(ALL_BOXES), units=units)
+    game.trail = []
+
+    def fill() -> bool:
+        if game.apply_constraint(CONSTRAINTS) == ValueResult.ERROR or not game.is_viable():
+            return False
+        box = game.cell_with_fewer_values()
+        if box is None:
+            return game.is_valid()
+        checkpoint = game.checkpoint()
+        values = list(MASK_BITS[game.get_box_mask(box)])
+        rng.shuffle(values)
+        for value in values:
+            game.set_box_mask(box, value)
+            if fill():
+                return True
+            game.undo(checkpoint)
+        return False
+
+    if not fill():
+        raise ValueError('the units do not admit a complete grid')
+    return game.cells
+
+
+def remove_clues(solution: Cells, rng: random.Random, units: List[Unit], min_clues=17) -> Cells:
+    """Removes the clues of a complete grid in random order, keeping only the removals that leave a unique
+       solution. Removing a clue from a unique puzzle keeps it unique iff no solution puts another value
+       in that box, so every check is a single search on the givens with that box restricted to the other
+       values. All the checks run on one board of givens, each one is undone to its checkpoint, and share a
+       transposition table"""
+    givens = Sudoku(solution[:], units=units)
+    givens.trail = []
+    table = TranspositionTable()
+    clues = len(givens.cells)
+    order = list(range(len(givens.cells)))
+    rng.shuffle(order)
+    for ix in order:
+        if clues <= min_clues:
+            break
+        value = givens.cells[ix]
+        checkpoint = givens.checkpoint()
+        givens.release_box(ix, FULL_MASK & ~value)
+        unique = not _explore(givens, CONSTRAINTS, Propagation.QUEUE, None, 0, 1, table=table)
+        givens.undo(checkpoint)
+        if unique:
+            givens.release_box(ix, FULL_MASK)
+            clues -= 1
+    return givens.cells
+
+
+def grade(grid: str, use_diagonal=False) -> Tuple[str, List[str], int]:
+    """The grade of a puzzle: the shortest prefix of CONSTRAINTS that solves it by propagation alone
+       ('expert' when search is needed), the strategies in that prefix and the search nodes of a full solve.
+       The grade only depends on the strategies, the nodes are reported alongside it"""
+    units = ALL_UNITS if use_diagonal else NOT_DIAGONAL_UNITS
+    level = len(CONSTRAINTS)
+    for k in range(1, len(CONSTRAINTS) + 1):
+        game = Sudoku(grid, units=units)
+        if game.apply_constraint(CONSTRAINTS[:k]) != ValueResult.ERROR and game.is_solved():
+            level = k - 1
+            break
+    stats = SolveStats()
+    solve(grid, use_diagonal, stats=stats)
+    strategies = [c.__name__ for c in CONSTRAINTS[:level + 1]]
+    return GRADES[level], strategies, stats.nodes
+
+
+def generate(seed: Optional[int] = None, use_diagonal=False, min_clues=17) -> GeneratedPuzzle:
+    """
+    Generate a puzzle with a unique solution.
+    Args:
+        seed: seed of the random generator, the same seed always gives the same puzzle
+        use_diagonal: If true the puzzle is a diagonal sudoku
+        min_clues: stop removing clues at this count
+    Returns:
+        The puzzle with its solution and grade
+    """
+    rng = random.Random(seed)
+    units = ALL_UNITS if use_diagonal else NOT_DIAGONAL_UNITS
+    solution = random_solution(rng, units)
+    givens = remove_clues(solution, rng, units, min_clues)
+    grid = string_from_cells(givens)
+    level, strategies, nodes = grade(grid, use_diagonal)
+    clues = sum(1 for m in givens if POPCOUNT[m] == 1)
+    return GeneratedPuzzle(grid, string_from_cells(solution), clues, level, strategies, nodes, seed)
+
+
+def _init_worker(use_diagonal: bool):
+    unit_index(ALL_UNITS if use_diagonal else NOT_DIAGONAL_UNITS)
+
+
+def _generate(args) -> GeneratedPuzzle:
+    return generate(*args)
+
+
+def generate_many(count: int, seed=0, use_diagonal=False, min_clues=17,
+                  workers: Optional[int] = None) -> Iterator[GeneratedPuzzle]:
+    """Generates count puzzles across worker processes, puzzle i uses the seed seed + i.
+       workers=0 generates them in the calling process"""
+    jobs = [(seed + i, use_diagonal, min_clues) for i in range(count)]
+    if workers == 0:
+        yield from map(_generate, jobs)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(use_diagonal,)) as pool:
+        yield from pool.map(_generate, jobs)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Generate graded sudoku puzzles with a unique solution')
+    parser.add_argument('count', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--diagonal', action='store_true', help='generate diagonal sudokus')
+    parser.add_argument('--min-clues', type=int, default=17)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, 0 generates in process')
+    args = parser.parse_args(argv)
+    for puzzle in generate_many(args.count, args.seed, args.diagonal, args.min_clues, args.workers):
+        print(puzzle.grid, puzzle.clues, puzzle.grade, puzzle.nodes, sep='\t')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+from collections import Counter
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from unit_builder import Constraint, ValueResult
+
+Listener = Callable[[str, dict], None]
+
+
+class SolveStats(object):
+    """Counters of the work done by a solve. Pass an instance to solution.solve to collect them,
+       the solver only checks for None when no instance is given.
+       Listeners are called with the name of every event and its data:
+         node: {'depth'}            a search node was entered
+         backtrack: {'depth'}       a branch failed and the search moved to the next value
+         restart: {}                the search ran out of its node budget and started again from the root
+         propagation: {}            apply_constraint was run
+         transposition: {'hit'}     the transposition table was looked up
+         strategy: {'strategy', 'result', 'seconds'}   a strategy was applied to a unit
+    """
+    def __init__(self, listeners: Iterable[Listener] = ()):
+        self.listeners: List[Listener] = list(listeners)
+        self.solves = 0
+        self.nodes = 0
+        self.backtracks = 0
+        self.max_depth = 0
+        self.restarts = 0
+        self.propagations = 0
+        self.table_lookups = 0
+        self.table_hits = 0
+        self.strategy_calls: Counter = Counter()
+        self.strategy_results: Counter = Counter()
+        self.strategy_seconds: Counter = Counter()
+        self._instrumented: Dict[Tuple[Constraint, ...], List[Constraint]] = {}
+
+    def subscribe(self, listener: Listener):
+        self.listeners.append(listener)
+
+    def _emit(self, event: str, data: dict):
+        for listener in self.listeners:
+            listener(event, data)
+
+    def node(self, depth: int):
+        self.nodes += 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if self.listeners:
+            self._emit('node', {'depth': depth})
+
+    def backtrack(self, depth: int):
+        self.backtracks += 1
+        if self.listeners:
+            self._emit('backtrack', {'depth': depth})
+
+    def restart(self):
+        self.restarts += 1
+        if self.listeners:
+            self._emit('restart', {})
+
+    def propagation(self):
+        self.propagations += 1
+        if self.listeners:
+            self._emit('propagation', {})
+
+    def transposition(self, hit: bool):
+        self.table_lookups += 1
+        self.table_hits += hit
+        if self.listeners:
+            self._emit('transposition', {'hit': hit})
+
+    @property
+    def table_hit_rate(self) -> float:
+        return self.table_hits / self.table_lookups if self.table_lookups else 0.0
+
+    def strategy(self, name: str, result: ValueResult, seconds: float):
+        self.strategy_calls[name] += 1
+        self.strategy_results[(name, result.name)] += 1
+        self.strategy_seconds[name] += seconds
+        if self.listeners:
+            self._emit('strategy', {'strategy': name, 'result': result, 'seconds': seconds})
+
+    def instrument(self, constraints: List[Constraint]) -> List[Constraint]:
+        """The constraints wrapped to count their calls, results and time, built once per sequence of them"""
+        key = tuple(constraints)
+        if key not in self._instrumented:
+            self._instrumented[key] = [self._timed(constraint) for constraint in constraints]
+        return self._instrumented[key]
+
+    def _timed(self, constraint: Constraint) -> Constraint:
+        name = constraint.__name__
+
+        def timed(sudoku, unit):
+            start = perf_counter()
+            result = constraint(sudoku, unit)
+            self.strategy(name, result, perf_counter() - start)
+            return result
+
+        timed.__name__ = name
+        return timed
+
+    def merge(self, other: 'SolveStats') -> 'SolveStats':
+        """Adds the counters of other to these, for aggregating the stats of a batch"""
+        self.solves += other.solves
+        self.nodes += other.nodes
+        self.backtracks += other.backtracks
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.restarts += other.restarts
+        self.propagations += other.propagations
+        self.table_lookups += other.table_lookups
+        self.table_hits += other.table_hits
+        self.strategy_calls.update(other.strategy_calls)
+        self.strategy_results.update(other.strategy_results)
+        self.strategy_seconds.update(other.strategy_seconds)
+        return self
+
+    def as_dict(self) -> dict:
+        strategies = {name: {'calls': calls, 'seconds': self.strategy_seconds[name],
+                             'results': {result: count for (n, result), count in self.strategy_results.items()
+                                         if n == name}}
+                      for name, calls in self.strategy_calls.items()}
+        return {'solves': self.solves, 'nodes': self.nodes, 'backtracks': self.backtracks,
+                'max_depth': self.max_depth, 'restarts': self.restarts, 'propagations': self.propagations,
+                'table_lookups': self.table_lookups, 'table_hits': self.table_hits, 'strategies': strategies}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'SolveStats':
+        stats = cls()
+        for field in ('solves', 'nodes', 'backtracks', 'max_depth', 'restarts', 'propagations', 'table_lookups',
+                      'table_hits'):
+            setattr(stats, field, data[field])
+        for name, strategy in data['strategies'].items():
+            stats.strategy_calls[name] = strategy['calls']
+            stats.strategy_seconds[name] = strategy['seconds']
+            for result, count in strategy['results'].items():
+                stats.strategy_results[(name, result)] = count
+        return stats
+
+    def to_prometheus(self, prefix='sudoku') -> str:
+        """The counters in the Prometheus text exposition format"""
+        lines = []
+
+        def metric(name, kind, samples):
+            lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+            for labels, value in samples:
+                label_text = ','.join('%s="%s"' % item for item in labels)
+                lines.append('%s_%s%s %s' % (prefix, name, '{%s}' % label_text if labels else '', value))
+
+        metric('solves_total', 'counter', [((), self.solves)])
+        metric('search_nodes_total', 'counter', [((), self.nodes)])
+        metric('search_backtracks_total', 'counter', [((), self.backtracks)])
+        metric('search_max_depth', 'gauge', [((), self.max_depth)])
+        metric('search_restarts_total', 'counter', [((), self.restarts)])
+        metric('propagations_total', 'counter', [((), self.propagations)])
+        metric('table_lookups_total', 'counter', [((), self.table_lookups)])
+        metric('table_hits_total', 'counter', [((), self.table_hits)])
+        metric('strategy_calls_total', 'counter',
+               [((('strategy', name),), count) for name, count in sorted(self.strategy_calls.items())])
+        metric('strategy_results_total', 'counter',
+               [((('strategy', name), ('result', result)), count)
+                for (name, result), count in sorted(self.strategy_results.items())])
+        metric('strategy_seconds_total', 'counter',
+               [((('strategy', name),), '%.9f' % seconds) for name, seconds in sorted(self.strategy_seconds.items())])
+        return '\n'.join(lines) + '\n'
+
+
+def aggregate(stats: Iterable[Optional[SolveStats]]) -> SolveStats:
+    """The sum of the stats of many solves, None entries are skipped"""
+    total = SolveStats()
+    for s in stats:
+        if s is not None:
+            total.merge(s)
+    return total
@@ -0,0 +1,50 @@
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, Set, Tuple
+
+from bitboard import Cells, Mask
+
+# a decision of the search: the box index and the single value bit assigned to it
+Decision = Tuple[int, Mask]
+Nogood = FrozenSet[Decision]
+
+
+class NogoodStore(object):
+    """
+    Nogoods learned by a search: sets of assignments that, with the givens of the puzzle, leave no solution.
+    A store only holds for the puzzle it was learned on. Nogoods of more than max_size assignments are not
+    kept and, once capacity are stored, the oldest one is dropped for every new one.
+    Every nogood is indexed by each of its assignments so a branch can be checked against the nogoods it
+    would complete.
+    """
+    def __init__(self, capacity=4096, max_size=12):
+        self.capacity = capacity
+        self.max_size = max_size
+        self.nogoods: OrderedDict = OrderedDict()
+        self.watch: Dict[Decision, Set[Nogood]] = {}
+        self.learned = 0
+        self.pruned = 0
+        self.backjumps = 0
+
+    def __len__(self):
+        return len(self.nogoods)
+
+    def add(self, decisions: Iterable[Decision]):
+        nogood = frozenset(decisions)
+        if len(nogood) > self.max_size or nogood in self.nogoods:
+            return
+        if len(self.nogoods) >= self.capacity:
+            oldest, _ = self.nogoods.popitem(last=False)
+            for decision in oldest:
+                self.watch[decision].discard(oldest)
+        self.nogoods[nogood] = None
+        for decision in nogood:
+            self.watch.setdefault(decision, set()).add(nogood)
+        self.learned += 1
+
+    def blocks(self, cells: Cells, ix: int, bit: Mask) -> bool:
+        """True if assigning bit to box ix completes a nogood on a board with these cells"""
+        for nogood in self.watch.get((ix, bit), ()):
+            if all(cells[box] == value for box, value in nogood if box != ix):
+                self.pruned += 1
+                return True
+        return False
@@ -0,0 +1,195 @@
+import multiprocessing
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, NamedTuple, Optional, Set, Tuple
+
+from unit_builder import Constraint, ValueResult, Propagation, Branching, ValueOrder, geometry, geometry_of
+from bitboard import mask_tables
+from strategies import CONSTRAINTS
+from instrumentation import SolveStats
+from branching import BranchingPolicy
+from budget import Budget, BudgetExceeded, CancellationToken
+from solution import Sudoku, _explore
+
+
+class SubtreeResult(NamedTuple):
+    count: int
+    solution: Optional[bytes]
+    stats: Optional[dict]
+    cancelled: bool
+
+
+# A subtree sent to a worker: the candidate buffer as raw bytes, the box size n, use_diagonal,
+# the number of solutions wanted and whether to collect stats
+Job = Tuple[bytes, int, bool, int, bool]
+
+
+_CANCEL = None
+_STRATEGIES: List[Constraint] = CONSTRAINTS
+_BRANCHING = (Branching.MRV, ValueOrder.ASCENDING)
+
+
+def _init_worker(cancel, strategies: List[Constraint], box_order: Branching, value_order: ValueOrder):
+    """Runs once per worker process: keeps the shared cancel event and the search configuration"""
+    global _CANCEL, _STRATEGIES, _BRANCHING
+    _CANCEL = cancel
+    _STRATEGIES = strategies
+    _BRANCHING = (box_order, value_order)
+
+
+def _search_subtree(job: Job) -> SubtreeResult:
+    cells, n, use_diagonal, limit, collect_stats = job
+    buffer = array(mask_tables(n).cell_type)
+    buffer.frombytes(cells)
+    game = Sudoku(buffer, units=geometry(n).units(use_diagonal))
+    stats = SolveStats() if collect_stats else None
+    constraints = stats.instrument(_STRATEGIES) if stats is not None else _STRATEGIES
+    policy = BranchingPolicy(*_BRANCHING)
+    game.trail = []
+    try:
+        count = _explore(game, constraints, Propagation.QUEUE, stats, 0, limit, policy,
+                         Budget(token=CancellationToken(_CANCEL)))
+    except BudgetExceeded:
+        return SubtreeResult(0, None, stats.as_dict() if stats is not None else None, True)
+    solution = game.cells.tobytes() if count >= limit else None
+    return SubtreeResult(count, solution, stats.as_dict() if stats is not None else None, False)
+
+
+def split_frontier(game: Sudoku, depth: int, constraints: List[Constraint], policy: BranchingPolicy,
+                   limit: int, stats: Optional[SolveStats] = None) -> Tuple[List[bytes], List[bytes]]:
+    """Expands the search tree of a board depth branching levels down, as the search would. Returns the
+       propagated boards left open at that depth and the solutions met on the way (at most limit), both as
+       raw candidate buffers. The board is restored before returning"""
+    frontier: List[bytes] = []
+    solutions: List[bytes] = []
+
+    def expand(level: int):
+        if stats is not None:
+            stats.node(level)
+            stats.propagation()
+        if game.apply_constraint(constraints) == ValueResult.ERROR or not game.is_viable():
+            return
+        box = policy.select(game)
+        if box is None:
+            if game.is_valid():
+                solutions.append(game.cells.tobytes())
+            return
+        if level == depth:
+            frontier.append(game.cells.tobytes())
+            return
+        checkpoint = game.checkpoint()
+        for value in policy.values(game, box):
+            game.set_box_mask(box, value)
+            expand(level + 1)
+            game.undo(checkpoint)
+            if len(solutions) >= limit:
+                return
+
+    game.trail = []
+    checkpoint = game.checkpoint()
+    try:
+        expand(0)
+    finally:
+        game.undo(checkpoint)
+        game.trail = None
+    return frontier, solutions
+
+
+class ParallelSearch(object):
+    """
+    Search a single puzzle on many cores: the tree is expanded frontier_depth levels in the calling process
+    and the open subtrees are searched by a pool of workers. Looking for a solution, the workers still running
+    are cancelled as soon as one finds it; counting, every result is gathered until the limit is reached.
+    The pool is kept between puzzles, use it as a context manager or call close.
+    """
+    def __init__(self, workers: Optional[int] = None, frontier_depth=3, strategies: List[Constraint] = CONSTRAINTS,
+                 branching: Branching = Branching.MRV, value_order: ValueOrder = ValueOrder.ASCENDING):
+        self.workers = workers or os.cpu_count() or 1
+        self.frontier_depth = frontier_depth
+        self.strategies = strategies
+        self.policy = BranchingPolicy(branching, value_order)
+        self.cancel = multiprocessing.Event()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                        initargs=(self.cancel, strategies, branching, value_order))
+        self.running: Set = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.cancel.set()
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def _search(self, grid: str, use_diagonal: bool, limit: int,
+                stats: Optional[SolveStats]) -> Tuple[int, Optional[Sudoku]]:
+        layout = geometry_of(len(grid))
+        units = layout.units(use_diagonal)
+        if stats is not None:
+            stats.solves += 1
+        constraints = stats.instrument(self.strategies) if stats is not None else self.strategies
+        frontier, solutions = split_frontier(Sudoku(grid, units=units), self.frontier_depth, constraints,
+                                             self.policy, limit, stats)
+        found = len(solutions)
+        first = solutions[0] if solutions else None
+
+        # the subtrees cancelled by the previous puzzle must be gone before the event is cleared
+        wait(self.running)
+        self.cancel.clear()
+        pending = {self.pool.submit(_search_subtree, (cells, layout.n, use_diagonal, limit - found, stats is not None))
+                   for cells in (frontier if found < limit else [])}
+        while pending and found < limit:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                found += result.count
+                if first is None and result.solution is not None:
+                    first = result.solution
+                if stats is not None and result.stats is not None:
+                    stats.merge(SolveStats.from_dict(result.stats))
+        if pending:
+            self.cancel.set()
+            self.running = {future for future in pending if not future.cancel()}
+
+        solution = None
+        if first is not None:
+            buffer = array(mask_tables(layout.n).cell_type)
+            buffer.frombytes(first)
+            solution = Sudoku(buffer, units=units)
+        return min(found, limit), solution
+
+    def solve(self, grid: str, use_diagonal=False, stats: Optional[SolveStats] = None) -> Optional[Sudoku]:
+        """The solved Sudoku, None if no solution exists"""
+        return self._search(grid, use_diagonal, 1, stats)[1]
+
+    def count_solutions(self, grid: str, limit=2, use_diagonal=False, stats: Optional[SolveStats] = None) -> int:
+        """The number of solutions, at most limit"""
+        return self._search(grid, use_diagonal, limit, stats)[0]
+
+
+def solve_parallel(grid: str, use_diagonal=False, workers: Optional[int] = None, frontier_depth=3,
+                   stats: Optional[SolveStats] = None, **kwargs) -> Optional[Sudoku]:
+    """
+    Find the solution to a Sudoku grid searching its subtrees on a pool of processes.
+    Args:
+        grid(string): a string representing a sudoku grid
+        use_diagonal: If true it will enforce a diagonal sudoku
+        workers: number of processes, None for one per core
+        frontier_depth: branching levels expanded before handing the subtrees to the workers
+        stats: If given, the counters of the search in every process are added to it
+        kwargs: strategies, branching and value_order, as for solution.solve
+    Returns:
+        The solved Sudoku, None if no solution exists.
+    """
+    with ParallelSearch(workers, frontier_depth, **kwargs) as search:
+        return search.solve(grid, use_diagonal, stats)
+
+
+def count_solutions_parallel(grid: str, limit=2, use_diagonal=False, workers: Optional[int] = None,
+                             frontier_depth=3, stats: Optional[SolveStats] = None, **kwargs) -> int:
+    """Same as solution.count_solutions, searching the subtrees on a pool of processes"""
+    with ParallelSearch(workers, frontier_depth, **kwargs) as search:
+        return search.count_solutions(grid, limit, use_diagonal, stats)
@@ -0,0 +1,122 @@
+import mmap
+import os
+import re
+from typing import IO, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+GRID_LENGTH = 81
+_GRID = re.compile(rb'(?<![0-9.])[0-9.]{%d}(?![0-9.])' % GRID_LENGTH)
+_PLAIN_GRID = re.compile(rb'[1-9.]{%d}' % GRID_LENGTH)
+_ID_SEPARATORS = ' \t,;:|'
+
+
+class Puzzle(NamedTuple):
+    """A puzzle read from a file: the grid uses '.' for empty boxes, the layout of its line is kept
+       in prefix, suffix and blank so a solution can be written back the same way"""
+    grid: str
+    id: Optional[str] = None
+    prefix: str = ''
+    suffix: str = ''
+    blank: str = '.'
+
+
+def parse_line(line: bytes) -> Optional[Puzzle]:
+    """Parses one line, None for blank lines, comments and lines without a grid"""
+    line = line.rstrip(b'\r\n')
+    if len(line) == GRID_LENGTH and _PLAIN_GRID.fullmatch(line):
+        return Puzzle(line.decode('ascii'))
+    if not line.strip() or line.lstrip().startswith(b'#'):
+        return None
+    match = _GRID.search(line.split(b'#', 1)[0])
+    if not match:
+        return None
+    grid = match.group().decode('ascii')
+    blank = '0' if '0' in grid else '.'
+    prefix = line[:match.start()].decode('utf-8')
+    suffix = line[match.end():].decode('utf-8')
+    id = (prefix + suffix.split('#', 1)[0]).strip(_ID_SEPARATORS)
+    return Puzzle(grid.replace('0', '.'), id or None, prefix, suffix, blank)
+
+
+def format_like(puzzle: Puzzle, grid: str) -> str:
+    """Formats a grid with the layout of the line the puzzle was read from"""
+    if puzzle.blank != '.':
+        grid = grid.replace('.', puzzle.blank)
+    return puzzle.prefix + grid + puzzle.suffix
+
+
+def iter_puzzles(lines: Iterable[bytes]) -> Iterator[Puzzle]:
+    for line in lines:
+        puzzle = parse_line(line)
+        if puzzle is not None:
+            yield puzzle
+
+
+def read_puzzles(source: Union[str, IO[bytes]], buffer_size=1 << 20) -> Iterator[Puzzle]:
+    """Generator over the puzzles of a file name or binary file, the file is read in buffered blocks"""
+    if isinstance(source, str):
+        with open(source, 'rb', buffering=buffer_size) as f:
+            yield from iter_puzzles(f)
+    else:
+        yield from iter_puzzles(source)
+
+
+def split_ranges(path: str, parts: int) -> List[Tuple[int, int]]:
+    """Splits a file in at most parts byte ranges that start and end on line boundaries"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        bounds = [0]
+        for k in range(1, parts):
+            newline = mm.find(b'\n', max(bounds[-1], size * k // parts))
+            if newline < 0:
+                break
+            if newline + 1 < size:
+                bounds.append(newline + 1)
+        bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def read_range(path: str, start: int, end: int) -> Iterator[Puzzle]:
+    """Generator over the puzzles of a byte range of a memory mapped file, see split_ranges"""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = start
+        while pos < end:
+            newline = mm.find(b'\n', pos, end)
+            stop = newline if newline >= 0 else end
+            puzzle = parse_line(mm[pos:stop])
+            if puzzle is not None:
+                yield puzzle
+            pos = stop + 1
+
+
+class PuzzleWriter(object):
+    """Writes grids in the layout of the puzzles they come from, buffering lines into bulk writes"""
+    def __init__(self, target: Union[str, IO[str]], buffer_lines=4096):
+        self.owned = isinstance(target, str)
+        self.file: IO[str] = open(target, 'w') if self.owned else target
+        self.buffer_lines = buffer_lines
+        self.lines: List[str] = []
+
+    def write(self, puzzle: Puzzle, grid: str):
+        self.lines.append(format_like(puzzle, grid))
+        if len(self.lines) >= self.buffer_lines:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.lines.append('')
+            self.file.write('\n'.join(self.lines))
+            self.lines = []
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.owned:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
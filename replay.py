@@ -0,0 +1,120 @@
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pygame
+
+from objects.SudokuSquare import AAfilledRoundedRect
+
+digits = '123456789'
+rows = 'ABCDEFGHI'
+
+BACKGROUND = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images', 'sudoku-board-bare.jpg')
+SIZE = (700, 700)
+TILE = (45, 40)
+TEXT_OFFSET = (17, 4)
+ASSIGNED_COLOR = (2, 204, 186)
+EMPTY_COLOR = (255, 255, 255)
+TEXT_COLOR = (255, 255, 255)
+
+
+def box_origin(x: int, y: int) -> Tuple[int, int]:
+    """The top left corner of the tile of column x and row y on the board image"""
+    return x * 57 + (38, 99, 159)[x // 3], y * 57 + (35, 100, 165)[y // 3]
+
+
+class ReplayRenderer(object):
+    """
+    Draws a history of boards, the dictionaries visualize_assignments takes, as PySudoku.play does but:
+      - the tile of every value (and the empty tile) is rendered once, with its glyph, when the renderer is built
+      - a frame only redraws the boxes whose value changed since the previous frame
+      - headless=True uses the SDL dummy video driver, frames can still be saved without a display
+    """
+    def __init__(self, headless=False, background: str = BACKGROUND):
+        if headless:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        pygame.init()
+        self.screen = pygame.display.set_mode(SIZE)
+        self.background = pygame.image.load(background).convert()
+        font = pygame.font.SysFont('opensans', 21)
+        self.tiles: Dict[str, pygame.Surface] = {'': self._tile(EMPTY_COLOR, None)}
+        for d in digits:
+            self.tiles[d] = self._tile(ASSIGNED_COLOR, font.render(d, 1, TEXT_COLOR))
+        self.rects = {row + col: pygame.Rect(box_origin(x, y), TILE)
+                      for y, row in enumerate(rows) for x, col in enumerate(digits)}
+        self.shown: Dict[str, Optional[str]] = {}
+        self.frames = 0
+
+    def _tile(self, color, glyph: Optional[pygame.Surface]) -> pygame.Surface:
+        tile = pygame.Surface(TILE, pygame.SRCALPHA)
+        AAfilledRoundedRect(tile, (0, 0) + TILE, color)
+        if glyph is not None:
+            tile.blit(glyph, TEXT_OFFSET)
+        return tile.convert_alpha()
+
+    def draw(self, values: Dict[str, str]) -> List[pygame.Rect]:
+        """Draws the next board and returns the rectangles that changed"""
+        if not self.shown:
+            self.screen.blit(self.background, (0, 0))
+        dirty = []
+        for box, rect in self.rects.items():
+            value = values[box]
+            value = value if len(value) == 1 and value in self.tiles else ''
+            if self.shown.get(box) == value:
+                continue
+            self.shown[box] = value
+            self.screen.blit(self.background, rect, rect)
+            self.screen.blit(self.tiles[value], rect)
+            dirty.append(rect)
+        self.frames += 1
+        return dirty
+
+    def save(self, path: str):
+        """Writes the current frame, the format follows the extension (.png, .bmp, .tga)"""
+        pygame.image.save(self.screen, path)
+
+    def play(self, values_list: Iterable[Dict[str, str]], fps=5):
+        """Shows the boards on the display at fps frames per second, updating only the changed boxes"""
+        clock = pygame.time.Clock()
+        for values in values_list:
+            pygame.event.pump()
+            first = not self.shown
+            dirty = self.draw(values)
+            if first:
+                pygame.display.flip()
+            else:
+                pygame.display.update(dirty)
+            clock.tick(fps)
+
+    def write_frames(self, values_list: Iterable[Dict[str, str]], directory: str,
+                     animation: Optional[str] = None, fps=5) -> int:
+        """Renders the boards to directory/frame_00000.png, ... and, when animation is given, to an animated
+           GIF too (that needs Pillow). Returns the number of frames written"""
+        os.makedirs(directory, exist_ok=True)
+        images = []
+        written = 0
+        for values in values_list:
+            self.draw(values)
+            self.save(os.path.join(directory, 'frame_%05d.png' % written))
+            written += 1
+            if animation is not None:
+                images.append(pygame.image.tostring(self.screen, 'RGB'))
+        if animation is not None and images:
+            save_animation(images, animation, fps)
+        return written
+
+
+def save_animation(frames: List[bytes], path: str, fps=5):
+    """Writes RGB frames of the board size to an animated GIF"""
+    from PIL import Image
+    images = [Image.frombytes('RGB', SIZE, frame).convert('P', palette=Image.ADAPTIVE) for frame in frames]
+    images[0].save(path, save_all=True, append_images=images[1:], duration=1000 // fps, loop=0)
+
+
+def render_replay(values_list: Iterable[Dict[str, str]], directory: str, animation: Optional[str] = None,
+                  fps=5) -> int:
+    """Renders a replay headless, see ReplayRenderer.write_frames"""
+    renderer = ReplayRenderer(headless=True)
+    try:
+        return renderer.write_frames(values_list, directory, animation, fps)
+    finally:
+        pygame.quit()
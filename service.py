@@ -0,0 +1,321 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from unit_builder import geometry_of
+from budget import Budget, BudgetExceeded
+from solution import Sudoku, search_in_place
+
+SOLVED = 'solved'
+UNSOLVABLE = 'unsolvable'
+TIMEOUT = 'timeout'
+BUSY = 'busy'
+INVALID = 'invalid'
+ERROR = 'error'
+
+HTTP_STATUS = {SOLVED: '200 OK', UNSOLVABLE: '200 OK', TIMEOUT: '504 Gateway Timeout',
+               BUSY: '503 Service Unavailable', INVALID: '400 Bad Request', ERROR: '500 Internal Server Error'}
+
+
+def valid_grid(grid: str) -> bool:
+    """True if the grid has a square number of boxes, each a value of its size or '.' or '0' when empty"""
+    try:
+        layout = geometry_of(len(grid))
+    except ValueError:
+        return False
+    allowed = set(layout.digits + '.0')
+    return all(c in allowed for c in grid)
+
+
+def solve_until(grid: str, use_diagonal: bool, deadline: float) -> Tuple[str, Optional[str]]:
+    """Solves a grid in a worker process giving up at the deadline, returns the status and the solution"""
+    if not valid_grid(grid):
+        return INVALID, None
+    game = Sudoku(grid, units=geometry_of(len(grid)).units(use_diagonal))
+    try:
+        game = search_in_place(game, budget=Budget(deadline))
+    except BudgetExceeded:
+        return TIMEOUT, None
+    return (SOLVED, str(game)) if game and game.is_solved() else (UNSOLVABLE, None)
+
+
+class SolveService(object):
+    """
+    Solves puzzles for many concurrent clients on a pool of worker processes.
+      - Concurrent requests for the same grid share one solve (and the deadline of the first of them)
+      - Every request has a timeout, the worker abandons the search once it passes
+      - At most queue_size distinct solves wait for a worker, further ones are answered BUSY at once
+    """
+    def __init__(self, workers: Optional[int] = None, queue_size=64, timeout=10.0, max_timeout=60.0):
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.max_timeout = max_timeout
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.in_flight: Dict[Tuple[str, bool], asyncio.Future] = {}
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.dispatchers: List[asyncio.Task] = []
+        self.counters: Dict[str, int] = {'requests': 0, 'coalesced': 0, SOLVED: 0, UNSOLVABLE: 0, TIMEOUT: 0,
+                                         BUSY: 0, INVALID: 0, ERROR: 0}
+
+    async def start(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.dispatchers = [asyncio.ensure_future(self._dispatch()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self.dispatchers:
+            task.cancel()
+        await asyncio.gather(*self.dispatchers, return_exceptions=True)
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    async def _dispatch(self):
+        """Hands the queued solves to the pool, one at a time per worker so the queue is the only backlog"""
+        loop = asyncio.get_running_loop()
+        while True:
+            grid, use_diagonal, deadline, future = await self.queue.get()
+            if time.time() >= deadline:
+                result = (TIMEOUT, None)
+            else:
+                try:
+                    result = await loop.run_in_executor(self.pool, solve_until, grid, use_diagonal, deadline)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+            if not future.done():
+                future.set_result(result)
+
+    async def solve(self, grid: str, use_diagonal=False, timeout: Optional[float] = None) -> Dict:
+        """Solves a grid, returning a dictionary with its status, solution, seconds and whether it was coalesced"""
+        start = time.perf_counter()
+        self.counters['requests'] += 1
+        if not valid_grid(grid):
+            return self._answer(INVALID, None, start, False)
+        timeout = min(timeout or self.timeout, self.max_timeout)
+        key = (grid, use_diagonal)
+        future = self.in_flight.get(key)
+        coalesced = future is not None
+        if coalesced:
+            self.counters['coalesced'] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            try:
+                self.queue.put_nowait((grid, use_diagonal, time.time() + timeout, future))
+            except asyncio.QueueFull:
+                return self._answer(BUSY, None, start, False)
+            self.in_flight[key] = future
+            future.add_done_callback(lambda done: self.in_flight.pop(key, None))
+        try:
+            status, solution = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            status, solution = TIMEOUT, None
+        except Exception:
+            status, solution = ERROR, None
+        return self._answer(status, solution, start, coalesced)
+
+    def _answer(self, status: str, solution: Optional[str], start: float, coalesced: bool) -> Dict:
+        self.counters[status] += 1
+        return {'status': status, 'solution': solution, 'seconds': time.perf_counter() - start,
+                'coalesced': coalesced}
+
+    def stats(self) -> Dict:
+        stats = dict(self.counters)
+        stats.update({'queued': self.queue.qsize(), 'in_flight': len(self.in_flight)})
+        return stats
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serves the HTTP/1.1 requests of a connection, kept alive until the client closes it:
+             GET /solve?grid=...&diagonal=1&timeout=5 or POST /solve with {"grid", "diagonal", "timeout"}
+             GET /stats
+        """
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except ValueError as e:
+                    self.counters[INVALID] += 1
+                    _write_response(writer, HTTP_STATUS[INVALID], {'status': INVALID, 'error': repr(e)},
+                                    keep_alive=False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, answer = await self._route(method, target, body)
+                _write_response(writer, status, answer, keep_alive=headers.get('connection') != 'close')
+                await writer.drain()
+                if headers.get('connection') == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, target: str, body: bytes) -> Tuple[str, Dict]:
+        url = urlsplit(target)
+        if url.path == '/stats' and method == 'GET':
+            return '200 OK', self.stats()
+        if url.path != '/solve' or method not in ('GET', 'POST'):
+            return '404 Not Found', {'error': 'use /solve or /stats'}
+        try:
+            if method == 'POST':
+                params = json.loads(body.decode('utf-8'))
+            else:
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            grid = params['grid']
+            if not isinstance(grid, str):
+                raise TypeError('the grid must be a string')
+            use_diagonal = str(params.get('diagonal', '')).lower() in ('1', 'true', 'yes')
+            timeout = float(params['timeout']) if params.get('timeout') else None
+        except (ValueError, KeyError, TypeError) as e:
+            self.counters[INVALID] += 1
+            return HTTP_STATUS[INVALID], {'status': INVALID, 'error': repr(e)}
+        answer = await self.solve(grid, use_diagonal, timeout)
+        return HTTP_STATUS[answer['status']], answer
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    method, target, _ = line.decode('latin-1').split(' ', 2)
+    headers = await _read_headers(reader)
+    body = await reader.readexactly(int(headers.get('content-length', 0)))
+    return method, target, headers, body
+
+
+async def _read_headers(reader: asyncio.StreamReader) -> Dict[str, str]:
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            return headers
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+
+def _write_response(writer: asyncio.StreamWriter, status: str, answer: Dict, keep_alive=True):
+    body = json.dumps(answer).encode('utf-8')
+    writer.write(('HTTP/1.1 %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: %s\r\n\r\n'
+                  % (status, len(body), 'keep-alive' if keep_alive else 'close')).encode('latin-1') + body)
+
+
+async def serve(service: SolveService, host='127.0.0.1', port=8080, unix: Optional[str] = None):
+    """Starts the service and serves HTTP on host:port, or on a unix socket when unix is a path"""
+    await service.start()
+    if unix:
+        server = await asyncio.start_unix_server(service.handle, unix)
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+    return server
+
+
+async def request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, grid: str, use_diagonal=False,
+                  timeout: Optional[float] = None) -> Dict:
+    """Sends one solve request on a kept alive connection and returns the decoded answer"""
+    params = {'grid': grid, 'diagonal': use_diagonal}
+    if timeout:
+        params['timeout'] = timeout
+    body = json.dumps(params).encode('utf-8')
+    writer.write(b'POST /solve HTTP/1.1\r\nHost: sudoku\r\nContent-Type: application/json\r\n'
+                 b'Content-Length: %d\r\n\r\n%s' % (len(body), body))
+    await writer.drain()
+    line = await reader.readline()
+    headers = await _read_headers(reader)
+    answer = json.loads(await reader.readexactly(int(headers['content-length'])))
+    answer['http_status'] = int(line.split()[1])
+    return answer
+
+
+async def load_test(puzzles: List[str], host='127.0.0.1', port=8080, unix: Optional[str] = None, concurrency=16,
+                    requests=200, use_diagonal=False, timeout: Optional[float] = None) -> Dict:
+    """
+    Sends requests solve requests from concurrency connections, cycling over the puzzles.
+    Returns:
+        The count of every status, the throughput and the p50 / p99 / max latencies in milliseconds
+    """
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    sent = iter(range(requests))
+
+    async def client():
+        if unix:
+            reader, writer = await asyncio.open_unix_connection(unix)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for i in sent:
+                t = time.perf_counter()
+                answer = await request(reader, writer, puzzles[i % len(puzzles)], use_diagonal, timeout)
+                latencies.append(time.perf_counter() - t)
+                statuses[answer['status']] = statuses.get(answer['status'], 0) + 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    ordered = sorted(latencies)
+
+    def percentile(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000
+
+    return {'requests': len(latencies), 'statuses': statuses, 'requests_per_second': len(latencies) / elapsed,
+            'p50_ms': percentile(0.50), 'p99_ms': percentile(0.99), 'max_ms': ordered[-1] * 1000}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Sudoku solving service and its load test client')
+    commands = parser.add_subparsers(dest='command', required=True)
+    server = commands.add_parser('serve', help='run the service')
+    load = commands.add_parser('load', help='load test a running service')
+    for command in (server, load):
+        command.add_argument('--host', default='127.0.0.1')
+        command.add_argument('--port', type=int, default=8080)
+        command.add_argument('--unix', help='use this unix socket instead of TCP')
+    server.add_argument('--workers', type=int, default=None, help='worker processes, one per core by default')
+    server.add_argument('--queue-size', type=int, default=64, help='solves waiting for a worker before BUSY')
+    server.add_argument('--timeout', type=float, default=10.0, help='default timeout of a request in seconds')
+    server.add_argument('--max-timeout', type=float, default=60.0)
+    load.add_argument('--concurrency', type=int, default=16)
+    load.add_argument('--requests', type=int, default=200)
+    load.add_argument('--file', help='puzzle file, the hard benchmark corpus by default')
+    load.add_argument('--diagonal', action='store_true')
+    load.add_argument('--timeout', type=float, default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == 'load':
+        if args.file:
+            from puzzle_io import read_puzzles
+            puzzles = [puzzle.grid for puzzle in read_puzzles(args.file)]
+        else:
+            from benchmark import CORPORA
+            puzzles = CORPORA['hard']
+        report = asyncio.run(load_test(puzzles, args.host, args.port, args.unix, args.concurrency, args.requests,
+                                       args.diagonal, args.timeout))
+        print(json.dumps(report, indent=2, sort_keys=True))
+        return 0
+
+    async def run():
+        service = SolveService(args.workers, args.queue_size, args.timeout, args.max_timeout)
+        server = await serve(service, args.host, args.port, args.unix)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await service.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,114 +1,377 @@
-from collections import Counter
+from array import array
+from bisect import bisect_right
+from collections import deque
 from itertools import chain
-from typing import List, Set, Union, Optional
+from typing import Dict, List, NamedTuple, Set, Tuple, Union, Optional
 
-from unit_builder import Box, Unit, Values, Board, Constraint, ValueResult
-from unit_builder import ROWS, COLS, BOX_VALUES, ALL_BOXES, NOT_DIAGONAL_UNITS, ALL_UNITS
+import time
+
+import random
+from unit_builder import Box, Unit, UnitCells, Values, Board, Constraint, ValueResult, Propagation, Backend
+from unit_builder import Branching, ValueOrder, SolveStatus
+from unit_builder import UnitIndex, unit_index, geometry_of
+from bitboard import Mask, Cells, MaskTables, mask_tables, zobrist_keys
+from bitboard import mask_of, values_of, cells_from_string, cells_from_board, board_from_cells, string_from_cells
+from bitboard import snapshot_from_cells
 from strategies import CONSTRAINTS
+from instrumentation import SolveStats
+from dlx import solve_exact_cover
+from branching import BranchingPolicy, Restart, DEFAULT_POLICY
+from budget import Budget, BudgetExceeded, CancellationToken
+from transposition import TranspositionTable
+from nogoods import Decision, NogoodStore
+from wire import Buffer, BoardView, WireForm, encode_many
+
+# branching decisions allowed to the first attempt of a search with restarts, doubled on every restart
+RESTART_BUDGET = 64
+
+# propagations a learning search may spend shrinking the nogood of every contradiction
+MINIMIZE_TESTS = 2
+
+
+class SolveResult(NamedTuple):
+    status: SolveStatus
+    board: Optional['Sudoku']
+    stats: Optional[SolveStats]
 
 
 class Sudoku(object):
-    def __init__(self, grid: Union[str, Board], assignments=[], units=ALL_UNITS):
-        """Construct a Sudoku from a String or a Board (Dictionary)"""
+    def __init__(self, grid: Union[str, Board, Cells], units: Optional[List[Unit]] = None, record=False,
+                 assignments: Optional[List[Dict[str, str]]] = None):
+        """Construct a Sudoku from a String, a Board (Dictionary) or a buffer of candidate masks.
+           The board can have any n*n by n*n size, when units is None they are all the units (diagonals
+           included) of the size of the grid.
+           If record is True every assignment is logged so the assignments can be replayed.
+           assignments, the earlier boards of the game, is still taken by keyword: a board given it records
+           and its assignments start with them"""
+        if units is None:
+            units = geometry_of(len(grid)).all_units
         self.__UNITS__ = units
+        self.index: UnitIndex = unit_index(units)
+        self.masks: MaskTables = mask_tables(self.index.geometry.n)
+        self.pending = deque(range(len(units)))
+        self.queued = bytearray(b'\x01' * len(units))
+        self.trail: Optional[List[Tuple[int, Mask]]] = None
         if isinstance(grid, str):
-            flat_board = zip(ALL_BOXES, grid)
-            self.board: Board = dict(map(lambda x: (x[0], set(chr(ord(x[1]))) if x[1] != '.' else BOX_VALUES),
-                                         flat_board))
-            self.assignments = []
-            self.__UNITS__ = units
+            self.cells: Cells = cells_from_string(grid, self.masks)
+
+        elif isinstance(grid, array):
+            self.cells = grid
 
         else:
-            self.board = grid
-            self.assignments = assignments[::]
-            self.__UNITS__ = units
+            self.cells = cells_from_board(grid, self.masks)
+        if len(self.cells) != len(self.masks.boxes):
+            raise ValueError('expected %d boxes, got %d' % (len(self.masks.boxes), len(self.cells)))
+        self._count_assignments()
+        zobrist = zobrist_keys(self.index.geometry.n)
+        self.keys = zobrist.box_keys
+        self.key: int = zobrist.hash(self.cells, self.masks.full_mask)
+
+        record = record or assignments is not None
+        self.history: Optional[List[Tuple[int, Mask]]] = [] if record else None
+        self.history_base: Optional[Cells] = self.cells[:] if record else None
+        self.earlier_assignments: List[Dict[str, str]] = list(assignments or [])
 
     def __str__(self):
-        return "".join(map(lambda it: '*' if len(it[1]) == 0 else
-                                      list(it[1])[0] if len(it[1]) == 1 else '.',
-                           sorted(self.board.items())))
+        return string_from_cells(self.cells, self.masks)
+
+    def to_bytes(self, form: WireForm = WireForm.MASKS) -> bytes:
+        """The board in the binary wire format (see wire.py): every candidate with MASKS, only the assigned
+           values with GIVENS"""
+        return encode_many([self.cells], form, self.index.geometry.n)
+
+    @classmethod
+    def from_bytes(cls, data: Buffer, units: Optional[List[Unit]] = None, record=False) -> 'Sudoku':
+        """The board of an encoding of a single board made by to_bytes"""
+        view = BoardView(data)
+        if len(view) != 1:
+            raise ValueError('expected one board, got %d' % len(view))
+        return cls(view[0], units, record)
+
+    @property
+    def board(self) -> Board:
+        """The candidates of every box as a Board (Dictionary of sets), built on demand"""
+        return board_from_cells(self.cells, self.masks)
 
     def copy(self):
         """Copy constructor necessary for search"""
-        return Sudoku(self.board.copy(), self.assignments, self.__UNITS__)
+        game = Sudoku.__new__(Sudoku)
+        game.__UNITS__ = self.__UNITS__
+        game.index = self.index
+        game.masks = self.masks
+        game.cells = self.cells[:]
+        game.counts = self.counts[:]
+        game.assigned = self.assigned
+        game.conflicts = self.conflicts
+        game.empty = self.empty
+        game.keys = self.keys
+        game.key = self.key
+        game.pending = deque(self.pending)
+        game.queued = self.queued[:]
+        game.trail = None
+        game.history = self.history[::] if self.history is not None else None
+        game.history_base = self.history_base
+        game.earlier_assignments = self.earlier_assignments
+        return game
+
+    @property
+    def assignments(self) -> List[Dict[str, str]]:
+        """The board after every assignment as the dictionaries visualize_assignments expects,
+           rebuilt from the history on demand (empty when the board is not recording)"""
+        snapshots = self.earlier_assignments[::]
+        if not self.history:
+            return snapshots
+        cells = self.history_base[:]
+        for ix, mask in self.history:
+            cells[ix] = mask
+            snapshots.append(snapshot_from_cells(cells, self.masks))
+        return snapshots
+
+    def _count_assignments(self):
+        """Builds the validity counters kept up to date by set_box_mask and undo:
+             counts: how many boxes of unit u hold the value with bit d, at u * size + d
+             assigned: boxes with a single value, empty: boxes without candidates
+             conflicts: (unit, value) pairs placed in more than one box of the unit"""
+        size = len(self.masks.digits)
+        popcount = self.masks.popcount
+        counts = self.counts = bytearray(size * len(self.index.unit_cells))
+        self.assigned = self.empty = self.conflicts = 0
+        for ix, m in enumerate(self.cells):
+            if not m:
+                self.empty += 1
+            elif popcount[m] == 1:
+                self.assigned += 1
+                d = m.bit_length() - 1
+                for u in self.index.cell_units[ix]:
+                    counts[u * size + d] += 1
+                    if counts[u * size + d] == 2:
+                        self.conflicts += 1
 
     def is_solved(self) -> bool:
         """True if all boxes has been assigned and the sudoku constraint holds for all units"""
-        return all(map(lambda it: len(it[1]) == 1, self.board.items())) and self.is_viable()
+        return self.assigned == len(self.cells) and not self.conflicts and not self.empty
 
     def is_valid(self) -> bool:
-        """Checks if the sudoku constraint holds for all units by checking the assigned boxes"""
-        def is_unit_valid(unit) -> bool:
-            values = set.union(*map(lambda box: self.board[box], unit))
-            return values == BOX_VALUES
-
-        unit_checks = map(is_unit_valid, self.__UNITS__)
-        return all(unit_checks)
-
-    def is_viable(self) -> bool:
-        """Returns True if the board can still be solved"""
-        def is_unit_viable(unit) -> bool:
-            empty = [self.board[box] for box in unit if len(self.board[box]) == 0]
-            if empty:
+        """Checks if the sudoku constraint holds for all units: every value is still possible in every unit
+           and no value is assigned twice in a unit"""
+        if self.conflicts or self.empty:
+            return False
+        if self.assigned == len(self.cells):
+            return True
+        cells = self.cells
+        full = self.masks.full_mask
+        for unit in self.index.unit_cells:
+            values = 0
+            for ix in unit:
+                values |= cells[ix]
+            if values != full:
                 return False
-            values = chain(*[list(self.board[box]) for box in unit if len(self.board[box]) == 1])
-            counts = Counter(values)
-            repeated = list(map(lambda x: x > 1, counts.values()))
-            return not any(repeated)
+        return True
 
-        unit_checks = list(map(is_unit_viable, self.__UNITS__))
-        return all(unit_checks)
+    def is_viable(self) -> bool:
+        """Returns True if no box is empty and no value is assigned twice in a unit"""
+        return not self.conflicts and not self.empty
 
     def is_not_solved(self) -> bool:
         return not self.is_solved()
 
     def is_unsolvable(self) -> bool:
         """True if a box has been assigned an empty value"""
-        return any(map(lambda it: len(it[1]) == 0, self.board.items()))
+        return self.empty > 0
 
     def is_solvable(self) -> bool:
         return not self.is_unsolvable()
 
     def get_box_value(self, ix: Box) -> Values:
-        return self.board[ix]
+        return values_of(self.cells[self.index.geometry.box_index[ix]], self.masks)
+
+    def get_box_mask(self, ix: int) -> Mask:
+        return self.cells[ix]
 
     def get_assigned_values(self, unit: Unit) -> Set[chr]:
         """Returns a set of the values of assigned boxes for a given unit"""
-        values = [self.board[box] for box in unit if len(self.board[box]) == 1]
-        return set.union(*values) if values else set()
+        box_index = self.index.geometry.box_index
+        return values_of(self.get_assigned_mask(tuple(box_index[box] for box in unit)), self.masks)
+
+    def get_assigned_mask(self, unit: UnitCells) -> Mask:
+        """Returns the union of the values of the assigned boxes of a unit as a bitmask"""
+        cells = self.cells
+        popcount = self.masks.popcount
+        assigned = 0
+        for ix in unit:
+            if popcount[cells[ix]] == 1:
+                assigned |= cells[ix]
+        return assigned
 
     def get_unassigned_values(self, unit: Unit) -> List[chr]:
         """Returns a list of all the values that remain to be assigned in the unit"""
-        return list(chain(*[self.board[box] for box in unit if len(self.board[box]) > 1]))
+        box_index = self.index.geometry.box_index
+        popcount, mask_values = self.masks.popcount, self.masks.mask_values
+        masks = [self.cells[box_index[box]] for box in unit]
+        return list(chain(*[mask_values[m] for m in masks if popcount[m] > 1]))
 
     def get_units_for_box(self, box: Box) -> List[Unit]:
         """Returns the units to which the box belongs"""
-        return list(filter(lambda unit: box in unit, self.__UNITS__))
+        return self.index.box_units[box]
+
+    def get_peers(self, box: Box) -> Set[Box]:
+        """Returns the boxes that share a unit with the box"""
+        return self.index.box_peers[box]
 
     def set_box_value(self, box: Box, v: Values) -> ValueResult:
-        """Sets the value of a box and return a Status:
-              ERROR: If it tries to assign a box already assigned
+        """Sets the value of a box from a set of values, see set_box_mask"""
+        return self.set_box_mask(self.index.geometry.box_index[box], mask_of(v, self.masks))
+
+    def set_box_mask(self, ix: int, mask: Mask) -> ValueResult:
+        """Sets the candidates of a box and return a Status:
+              ERROR: If it tries to assign a box already assigned or to empty it (nothing changes), or if
+                     it assigns a value already assigned to a peer (the change is kept, the board is no
+                     longer viable)
               UNCHANGED: If the new and the old value are the same
               OK: In all the other cases
               """
-        if not v or len(self.board[box]) == 1:
+        old = self.cells[ix]
+        popcount = self.masks.popcount
+        if not mask or popcount[old] == 1:
             return ValueResult.ERROR
 
-        if self.board[box] == v:
+        if old == mask:
             return ValueResult.UNCHANGED
 
-        self.board[box] = v
-        if len(v) == 1:
-            self.assignments.append(convert_board(self.board, reverse=True))
+        if self.trail is not None:
+            self.trail.append((ix, old))
+        self.cells[ix] = mask
+        self.key ^= self.keys[ix][old ^ mask]
+        queued = self.queued
+        for u in self.index.cell_units[ix]:
+            if not queued[u]:
+                queued[u] = 1
+                self.pending.append(u)
+        if self.history is not None and popcount[mask] == 1:
+            self.history.append((ix, mask))
+
+        if popcount[mask] == 1:
+            self.assigned += 1
+            counts = self.counts
+            size = len(self.masks.digits)
+            d = mask.bit_length() - 1
+            conflict = False
+            for u in self.index.cell_units[ix]:
+                counts[u * size + d] += 1
+                if counts[u * size + d] == 2:
+                    self.conflicts += 1
+                    conflict = True
+            if conflict:
+                return ValueResult.ERROR
 
         return ValueResult.OK
 
-    def apply_constraint(self, constraints: List[Constraint]):
-        """Repeatedly apply the strategies until no further simplification is possible"""
+    def release_box(self, ix: int, mask: Mask):
+        """Widens the candidates of a box that is not empty to mask, which may take back its assignment
+           (set_box_mask only narrows them). The change is on the trail and undo restores the old candidates"""
+        old = self.cells[ix]
+        popcount = self.masks.popcount
+        if self.trail is not None:
+            self.trail.append((ix, old))
+        self.cells[ix] = mask
+        self.key ^= self.keys[ix][old ^ mask]
+        queued = self.queued
+        for u in self.index.cell_units[ix]:
+            if not queued[u]:
+                queued[u] = 1
+                self.pending.append(u)
+        if popcount[old] == 1:
+            self.assigned -= 1
+            counts = self.counts
+            size = len(self.masks.digits)
+            d = old.bit_length() - 1
+            for u in self.index.cell_units[ix]:
+                if counts[u * size + d] == 2:
+                    self.conflicts -= 1
+                counts[u * size + d] -= 1
+
+    def checkpoint(self) -> Tuple[int, int, Tuple[int, ...]]:
+        """Marks the current state of a board whose changes are recorded on its trail"""
+        return len(self.trail), len(self.history) if self.history is not None else 0, tuple(self.pending)
+
+    def undo(self, checkpoint: Tuple[int, int, Tuple[int, ...]]):
+        """Restores the board to the state it had when the checkpoint was taken"""
+        trail_length, history_length, pending = checkpoint
+        trail = self.trail
+        cells = self.cells
+        popcount = self.masks.popcount
+        counts = self.counts
+        size = len(self.masks.digits)
+        cell_units = self.index.cell_units
+        keys = self.keys
+        while len(trail) > trail_length:
+            ix, old = trail.pop()
+            m = cells[ix]
+            self.key ^= keys[ix][old ^ m]
+            if popcount[m] == 1:
+                self.assigned -= 1
+                d = m.bit_length() - 1
+                for u in cell_units[ix]:
+                    if counts[u * size + d] == 2:
+                        self.conflicts -= 1
+                    counts[u * size + d] -= 1
+            if popcount[old] == 1 and popcount[m] != 1:
+                self.assigned += 1
+                d = old.bit_length() - 1
+                for u in cell_units[ix]:
+                    counts[u * size + d] += 1
+                    if counts[u * size + d] == 2:
+                        self.conflicts += 1
+            cells[ix] = old
+        if self.history is not None:
+            del self.history[history_length:]
+        self.queued[:] = bytes(len(self.queued))
+        self.pending = deque(pending)
+        for u in pending:
+            self.queued[u] = 1
+
+    def reduce_to(self, reduced: Cells):
+        """Moves the board to a reduction of it found by an earlier propagation, which leaves nothing pending"""
+        set_box_mask = self.set_box_mask
+        for ix, (old, new) in enumerate(zip(self.cells, reduced)):
+            if old != new:
+                set_box_mask(ix, new)
+        self.pending.clear()
+        self.queued[:] = bytes(len(self.queued))
+
+    def apply_constraint(self, constraints: List[Constraint], mode: Propagation = Propagation.QUEUE):
+        """Apply the strategies until no further simplification is possible:
+              QUEUE: only the units whose boxes changed since the last propagation are visited
+              FIXED_POINT: every unit is visited until a whole pass over the board changes nothing
+              """
+        if mode == Propagation.FIXED_POINT:
+            result = self._apply_constraint_fixed_point(constraints)
+            self.pending.clear()
+            self.queued[:] = bytes(len(self.queued))
+            return result
+
+        unit_cells = self.index.unit_cells
+        pending = self.pending
+        queued = self.queued
+        changed = False
+        while pending:
+            u = pending.popleft()
+            queued[u] = 0
+            unit = unit_cells[u]
+            for constraint in constraints:
+                result = constraint(self, unit)
+                if result == ValueResult.ERROR:
+                    return ValueResult.ERROR
+                changed = changed or result == ValueResult.OK
+
+        return changed
+
+    def _apply_constraint_fixed_point(self, constraints: List[Constraint]):
+        """Repeatedly apply the strategies to all the units until no further simplification is possible"""
         stalled_board = False
         while not stalled_board:
             stalled_board = True
-            for unit in self.__UNITS__:
+            for unit in self.index.unit_cells:
                 changed = False
                 stalled = False
                 while not stalled:
@@ -123,11 +386,20 @@ class Sudoku(object):
 
     def box_with_fewer_values(self) -> Optional[Box]:
         """Find the unassigned box with the fewer number of possible values"""
-        boxes = list(filter(lambda x: x[0] > 1, [(len(self.board[box]), box) for box in ALL_BOXES]))
-        box = None
-        if boxes:
-            _, box = min(filter(lambda x: x[0] > 1, [(len(self.board[box]), box) for box in ALL_BOXES]))
-        return box
+        ix = self.cell_with_fewer_values()
+        return self.index.geometry.boxes[ix] if ix is not None else None
+
+    def cell_with_fewer_values(self) -> Optional[int]:
+        """Index of the unassigned box with the fewer number of possible values, ties go to the first box"""
+        popcount = self.masks.popcount
+        best, best_count = None, len(self.masks.digits) + 1
+        for ix, m in enumerate(self.cells):
+            count = popcount[m]
+            if 1 < count < best_count:
+                best, best_count = ix, count
+                if count == 2:
+                    break
+        return best
 
     def display(self):
         """
@@ -135,12 +407,15 @@ class Sudoku(object):
         Args:
         values(dict): The sudoku in dictionary form
         """
-        width = 1 + max(len(self.board[s]) for s in ALL_BOXES)
-        line = '+'.join(['-' * (width * 3)] * 3)
-        for r in ROWS:
-            print(''.join("".join(sorted(self.board[(r, c)])).center(width) +
-                          ('|' if c in '36' else '') for c in COLS))
-            if r in 'CF':
+        layout = self.index.geometry
+        n, size = layout.n, layout.size
+        mask_values = self.masks.mask_values
+        width = 1 + max(self.masks.popcount[m] for m in self.cells)
+        line = '+'.join(['-' * (width * n)] * n)
+        for r in range(size):
+            print(''.join(mask_values[self.cells[r * size + c]].center(width) +
+                          ('|' if c % n == n - 1 and c < size - 1 else '') for c in range(size)))
+            if r % n == n - 1 and r < size - 1:
                 print(line)
 
 
@@ -151,48 +426,416 @@ def convert_board(grid, reverse=False) -> Board:
         return dict(map(lambda it: ((it[0][0], it[0][1]), set(list(it[1]))), grid.items()))
 
 
-def search(game: Sudoku, depth=0) -> Optional[Sudoku]:
+def search(game: Sudoku, depth=0, propagation: Propagation = Propagation.QUEUE,
+           stats: Optional[SolveStats] = None, strategies: List[Constraint] = CONSTRAINTS,
+           policy: BranchingPolicy = DEFAULT_POLICY, budget: Optional[Budget] = None) -> Optional[Sudoku]:
+    constraints = strategies
+    if budget is not None:
+        budget.charge(depth)
+    if stats is not None:
+        stats.node(depth)
+        constraints = stats.instrument(strategies)
     while game.is_viable() and game.is_not_solved():
-        game.apply_constraint(CONSTRAINTS)
-        if not game or not game.is_viable():
+        if stats is not None:
+            stats.propagation()
+        if game.apply_constraint(constraints, propagation) == ValueResult.ERROR or not game.is_viable():
             #print("BAD STRATEGY ", depth)
             #game.display()
             return None
 
         #print("Searching")
-        box_to_change = game.box_with_fewer_values()
-        if box_to_change:
-            for value in game.get_box_value(box_to_change):
+        box_to_change = policy.select(game)
+        if box_to_change is not None:
+            for value in policy.values(game, box_to_change):
                 new_game = game.copy()
-                new_game.set_box_value(box_to_change, set(value))
+                new_game.set_box_mask(box_to_change, value)
                 #print("Try Search: ", depth)
-                solution_attempt = search(new_game, depth+1)
+                solution_attempt = search(new_game, depth+1, propagation, stats, strategies, policy, budget)
                 if not solution_attempt or not solution_attempt.is_viable():
+                    if stats is not None:
+                        stats.backtrack(depth)
                     continue
                 return solution_attempt
+            return None
 
     return game if game and game.is_valid() else None
 
 
-def solve(grid: str, use_diagonal=False) -> Optional[Sudoku]:
+def search_in_place(game: Sudoku, propagation: Propagation = Propagation.QUEUE,
+                    stats: Optional[SolveStats] = None, strategies: List[Constraint] = CONSTRAINTS,
+                    policy: BranchingPolicy = DEFAULT_POLICY, budget: Optional[Budget] = None,
+                    table: Optional[TranspositionTable] = None) -> Optional[Sudoku]:
+    """Same depth first search as search, but every branch changes the same board: the removed candidates
+       are recorded on a trail and a failed branch is undone back to its checkpoint instead of copying the board.
+       When the policy raises Restart or the budget BudgetExceeded the board is restored before it propagates"""
+    constraints = stats.instrument(strategies) if stats is not None else strategies
+    game.trail = []
+    checkpoint = game.checkpoint()
+    try:
+        solved = _explore(game, constraints, propagation, stats, 0, 1, policy, budget, table)
+    except (Restart, BudgetExceeded):
+        game.undo(checkpoint)
+        raise
+    finally:
+        game.trail = None
+    return game if solved else None
+
+
+def search_with_restarts(game: Sudoku, policy: BranchingPolicy, restarts: int, in_place=True,
+                         propagation: Propagation = Propagation.QUEUE, stats: Optional[SolveStats] = None,
+                         strategies: List[Constraint] = CONSTRAINTS, restart_nodes=RESTART_BUDGET,
+                         budget: Optional[Budget] = None, table: Optional[TranspositionTable] = None
+                         ) -> Optional[Sudoku]:
+    """Searches from the root up to restarts + 1 times. Every attempt but the last may take restart_nodes
+       branching decisions, doubled on each restart, and a policy with a rng makes different choices on every
+       attempt. The budget and the table (in place only) are shared by all the attempts"""
+    for attempt in range(restarts + 1):
+        policy.nodes = 0
+        policy.node_budget = restart_nodes << attempt if attempt < restarts else None
+        try:
+            if in_place:
+                return search_in_place(game, propagation, stats, strategies, policy, budget, table)
+            return search(game, propagation=propagation, stats=stats, strategies=strategies, policy=policy,
+                          budget=budget)
+        except Restart:
+            if stats is not None:
+                stats.restart()
+    return None
+
+
+def _explore(game: Sudoku, constraints: List[Constraint], propagation: Propagation,
+             stats: Optional[SolveStats], depth: int, limit: int, policy: BranchingPolicy = DEFAULT_POLICY,
+             budget: Optional[Budget] = None, table: Optional[TranspositionTable] = None) -> int:
+    """Counts the solutions below the current board up to limit. When the limit is reached the board is left
+       holding the last solution found, otherwise it is restored to the state it had on entry.
+       With a table the board before and after propagation are looked up: a dead board is pruned and a known
+       one takes its reduced board instead of propagating, a board with no solution below is stored dead"""
+    if budget is not None:
+        budget.charge(depth)
+    if stats is not None:
+        stats.node(depth)
+    key = reduced_key = game.key
+    entry = None
+    if table is not None:
+        entry = table.get(key)
+        if stats is not None:
+            stats.transposition(entry is not None)
+        if entry is not None and entry.dead:
+            return 0
+    if entry is not None and entry.reduced is not None:
+        game.reduce_to(entry.reduced)
+        reduced_key = game.key
+    else:
+        if stats is not None:
+            stats.propagation()
+        if game.apply_constraint(constraints, propagation) == ValueResult.ERROR or not game.is_viable():
+            if table is not None:
+                table.put(key, depth, dead=True)
+            return 0
+        if table is not None:
+            table.put(key, depth, game.cells[:])
+            reduced_key = game.key
+            if reduced_key != key:
+                entry = table.get(reduced_key)
+                if stats is not None:
+                    stats.transposition(entry is not None)
+                if entry is not None and entry.dead:
+                    table.put(key, depth, dead=True)
+                    return 0
+
+    box_to_change = policy.select(game)
+    if box_to_change is None:
+        return 1 if game.is_valid() else 0
+
+    found = 0
+    checkpoint = game.checkpoint()
+    for value in policy.values(game, box_to_change):
+        game.set_box_mask(box_to_change, value)
+        found += _explore(game, constraints, propagation, stats, depth + 1, limit - found, policy, budget, table)
+        if found >= limit:
+            return found
+        game.undo(checkpoint)
+        if stats is not None:
+            stats.backtrack(depth)
+    if not found and table is not None:
+        table.put(key, depth, dead=True)
+        table.put(reduced_key, depth, dead=True)
+    return found
+
+
+def search_learning(game: Sudoku, nogoods: NogoodStore, propagation: Propagation = Propagation.QUEUE,
+                    stats: Optional[SolveStats] = None, strategies: List[Constraint] = CONSTRAINTS,
+                    policy: BranchingPolicy = DEFAULT_POLICY, budget: Optional[Budget] = None,
+                    minimize=MINIMIZE_TESTS) -> Optional[Sudoku]:
+    """Same search as search_in_place, learning from its failures: every contradiction adds to nogoods the
+       decisions behind it, shrunk by up to minimize extra propagations, and a branch completing a
+       nogood is pruned. When a failed branch did not depend on the decision above it the search backjumps
+       over the remaining values of that decision"""
+    constraints = stats.instrument(strategies) if stats is not None else strategies
+    if budget is not None:
+        budget.charge(0)
+    if stats is not None:
+        stats.node(0)
+        stats.propagation()
+    game.trail = []
+    checkpoint = game.checkpoint()
+    try:
+        if game.apply_constraint(constraints, propagation) == ValueResult.ERROR or not game.is_viable():
+            return None
+        learner = _Learner(game, constraints, propagation, stats, policy, budget, nogoods, minimize)
+        solved = learner.branch(0)[0]
+    except (Restart, BudgetExceeded):
+        game.undo(checkpoint)
+        raise
+    finally:
+        game.trail = None
+    return game if solved else None
+
+
+class _Learner(object):
+    """The state of a learning search: the decisions taken, indexed by level (the depth they were taken at),
+       and the trail length before each of them.
+       A node returns whether it solved the board and, when it did not, the levels of the decisions its
+       failure depends on: with the givens, the decisions at those levels leave no solution"""
+    def __init__(self, game: Sudoku, constraints: List[Constraint], propagation: Propagation,
+                 stats: Optional[SolveStats], policy: BranchingPolicy, budget: Optional[Budget],
+                 nogoods: NogoodStore, minimize: int):
+        self.game = game
+        self.constraints = constraints
+        self.propagation = propagation
+        self.stats = stats
+        self.policy = policy
+        self.budget = budget
+        self.nogoods = nogoods
+        self.minimize = minimize
+        self.decisions: List[Decision] = []
+        self.marks: List[int] = []
+
+    def node(self, depth: int) -> Tuple[bool, Set[int]]:
+        """Propagates the decision just taken and searches below it"""
+        if self.budget is not None:
+            self.budget.charge(depth)
+        if self.stats is not None:
+            self.stats.node(depth)
+            self.stats.propagation()
+        game = self.game
+        if game.apply_constraint(self.constraints, self.propagation) == ValueResult.ERROR or not game.is_viable():
+            levels = self._explain()
+            self.nogoods.add(self.decisions[level] for level in levels)
+            return False, levels
+        return self.branch(depth)
+
+    def branch(self, depth: int) -> Tuple[bool, Set[int]]:
+        game, stats = self.game, self.stats
+        box = self.policy.select(game)
+        if box is None:
+            return game.is_valid(), set(range(depth))
+
+        conflict: Set[int] = set()
+        checkpoint = game.checkpoint()
+        self.marks.append(checkpoint[0])
+        try:
+            for value in self.policy.values(game, box):
+                if self.nogoods.blocks(game.cells, box, value):
+                    conflict.update(range(depth))
+                    continue
+                self.decisions.append((box, value))
+                game.set_box_mask(box, value)
+                solved, levels = self.node(depth + 1)
+                self.decisions.pop()
+                if solved:
+                    return True, levels
+                game.undo(checkpoint)
+                if stats is not None:
+                    stats.backtrack(depth)
+                if depth not in levels:
+                    self.nogoods.backjumps += 1
+                    return False, levels
+                conflict.update(levels)
+            # the values the box had lost were removed by the decisions up to the last level that changed it
+            conflict.discard(depth)
+            conflict.update(range(self._last_level(box) + 1))
+        finally:
+            self.marks.pop()
+        self.nogoods.add(self.decisions[level] for level in conflict)
+        return False, conflict
+
+    def _last_level(self, box: int) -> int:
+        """The level of the last decision whose propagation removed candidates of box, -1 for the givens"""
+        trail = self.game.trail
+        for position in range(len(trail) - 1, -1, -1):
+            if trail[position][0] == box:
+                return bisect_right(self.marks, position) - 1
+        return -1
+
+    def _explain(self) -> Set[int]:
+        """The levels of the decisions behind the contradiction just found: all of them less those, from the
+           most recent, whose removal still gives a contradiction"""
+        levels = list(range(len(self.decisions)))
+        for level in range(len(levels) - 2, max(-1, len(levels) - 2 - self.minimize), -1):
+            if self._fails(level, [other for other in levels if other > level]):
+                levels.remove(level)
+        return set(levels)
+
+    def _fails(self, level: int, kept: List[int]) -> bool:
+        """True if propagation finds a contradiction on the board as it was before the decision at level
+           once the decisions at the kept levels are taken again. The board is rebuilt on a copy by undoing
+           the trail since that decision, so the test costs about as much as a search node"""
+        if self.stats is not None:
+            self.stats.propagation()
+        game = self.game.copy()
+        game.history = None
+        game.trail = self.game.trail[self.marks[level]:]
+        game.undo((0, 0, ()))
+        game.trail = None
+        for other in kept:
+            ix, bit = self.decisions[other]
+            mask = game.cells[ix]
+            if not mask & bit:
+                return True
+            if mask != bit and game.set_box_mask(ix, bit) == ValueResult.ERROR:
+                return True
+        return game.apply_constraint(self.constraints, self.propagation) == ValueResult.ERROR or not game.is_viable()
+
+
+def count_solutions(grid: Union[str, Sudoku], limit=2, use_diagonal=False,
+                    propagation: Propagation = Propagation.QUEUE, stats: Optional[SolveStats] = None,
+                    strategies: List[Constraint] = CONSTRAINTS, table: Optional[TranspositionTable] = None) -> int:
+    """
+    Count the solutions of a Sudoku grid, the search stops as soon as limit solutions are found.
+    Args:
+        grid: a string representing a sudoku grid or a Sudoku, which is copied and left unchanged
+        limit: the largest count of interest
+        use_diagonal: If true it will enforce a diagonal sudoku, ignored when grid is a Sudoku
+        propagation: QUEUE to revisit only the units that changed, FIXED_POINT to rescan the whole board
+        stats: If given, the counters of the search and of every strategy are added to it
+        strategies: the deductions propagated at every node, CONSTRAINTS by default
+        table: If given the boards met are remembered in it, share it between counts over the same units
+    Returns:
+        The number of solutions, at most limit.
+    """
+    if isinstance(grid, Sudoku):
+        game = grid.copy()
+    else:
+        game = Sudoku(grid, units=geometry_of(len(grid)).units(use_diagonal))
+    constraints = strategies
+    if stats is not None:
+        stats.solves += 1
+        constraints = stats.instrument(strategies)
+    game.trail = []
+    return _explore(game, constraints, propagation, stats, 0, limit, table=table)
+
+
+def has_unique_solution(grid: Union[str, Sudoku], use_diagonal=False) -> bool:
+    """True if the grid has exactly one solution"""
+    return count_solutions(grid, 2, use_diagonal) == 1
+
+
+def solve(grid: str, use_diagonal=False, propagation: Propagation = Propagation.QUEUE,
+          in_place=True, record=False, stats: Optional[SolveStats] = None,
+          backend: Backend = Backend.PROPAGATE, strategies: List[Constraint] = CONSTRAINTS,
+          branching: Branching = Branching.MRV, value_order: ValueOrder = ValueOrder.ASCENDING,
+          seed: Optional[int] = None, restarts=0, table: Optional[TranspositionTable] = None,
+          nogoods: Optional[NogoodStore] = None) -> Optional[Sudoku]:
     """
     Find the solution to a Sudoku grid.
     Args:
-        grid(string): a string representing a sudoku grid.
+        grid(string): a string representing a sudoku grid of any n*n by n*n size, one character per box.
             Example: '2.............62....1....7...6..8...3...9...7...6..4...4....8....52.............3'
         use_diagonal: If true it will enforce a diagonal sudoku
+        propagation: QUEUE to revisit only the units that changed, FIXED_POINT to rescan the whole board
+        in_place: If true search on a single board undoing failed branches, otherwise copy the board per branch
+        record: If true keep the history of assignments needed to visualize the solution
+        stats: If given, the counters of the search and of every strategy are added to it
+        backend: PROPAGATE for constraint propagation and search, DLX for the exact cover solver
+            (the DLX backend ignores propagation, in_place, record and strategies)
+        strategies: the deductions propagated at every node, CONSTRAINTS by default,
+            e.g. CONSTRAINTS + strategies.ADVANCED for fewer branches on hard puzzles
+        branching: MRV branches on the box with the fewest candidates, MRV_DEGREE breaks the ties by the
+            number of unassigned peers
+        value_order: ASCENDING or LEAST_CONSTRAINING (the values found in the fewest unassigned peers first)
+        seed: If given ties are broken and values shuffled at random, reproducibly for the same seed.
+            Without seed and restarts the search is deterministic
+        restarts: start the search again from the root up to this many times, with a growing node budget
+            (see search_with_restarts)
+        table: a TranspositionTable remembering the boards met by the in place search, it can be shared
+            between solves over the same units
+        nogoods: If given search learning nogoods into this store (a fresh one for every puzzle) and
+            backjumping, see search_learning. Used instead of restarts, in_place and table
     Returns:
         The dictionary representation of the final sudoku grid. False if no solution exists.
     """
-    game = Sudoku(grid, units=ALL_UNITS if use_diagonal else NOT_DIAGONAL_UNITS)
-    game = search(game)
-    return game if game and game.is_solved() else None
+    return _solve(grid, use_diagonal, None, propagation, in_place, record, stats, backend, strategies, branching,
+                  value_order, seed, restarts, table, nogoods).board
+
+
+def solve_with_budget(grid: str, use_diagonal=False, timeout: Optional[float] = None,
+                      max_nodes: Optional[int] = None, max_depth: Optional[int] = None,
+                      cancel: Optional[CancellationToken] = None, stats: Optional[SolveStats] = None,
+                      **kwargs) -> SolveResult:
+    """
+    Same as solve, giving up when the search runs out of its budget.
+    Args:
+        grid(string): a string representing a sudoku grid of any n*n by n*n size, one character per box.
+        use_diagonal: If true it will enforce a diagonal sudoku
+        timeout: seconds of wall clock the search may take
+        max_nodes / max_depth: the most search nodes the search may visit and the deepest it may branch
+        cancel: a token that stops the search once it is cancelled
+        stats: the counters of the search are added to it, a new SolveStats when None
+        kwargs: the other options of solve, the budget holds for the DLX backend too
+    Returns:
+        A SolveResult: its status, the solution when SOLVED, None when UNSOLVABLE and the board reduced by
+        propagation from the givens when the search was stopped, with the stats of the search.
+    """
+    deadline = time.time() + timeout if timeout is not None else None
+    stats = stats if stats is not None else SolveStats()
+    return _solve(grid, use_diagonal, Budget(deadline, max_nodes, max_depth, cancel), stats=stats, **kwargs)
+
+
+def _solve(grid: str, use_diagonal: bool, budget: Optional[Budget], propagation: Propagation = Propagation.QUEUE,
+           in_place=True, record=False, stats: Optional[SolveStats] = None,
+           backend: Backend = Backend.PROPAGATE, strategies: List[Constraint] = CONSTRAINTS,
+           branching: Branching = Branching.MRV, value_order: ValueOrder = ValueOrder.ASCENDING,
+           seed: Optional[int] = None, restarts=0, table: Optional[TranspositionTable] = None,
+           nogoods: Optional[NogoodStore] = None) -> SolveResult:
+    """solve and solve_with_budget, BudgetExceeded is only raised with a budget"""
+    if stats is not None:
+        stats.solves += 1
+    units = geometry_of(len(grid)).units(use_diagonal)
+    game = Sudoku(grid, units=units, record=record)
+    try:
+        if backend == Backend.DLX:
+            solution = solve_exact_cover(grid, units, stats, budget)
+            return _result(Sudoku(solution, units=units) if solution else None, stats)
+
+        policy = DEFAULT_POLICY
+        if branching != Branching.MRV or value_order != ValueOrder.ASCENDING or seed is not None or restarts:
+            rng = random.Random(seed) if seed is not None or restarts else None
+            policy = BranchingPolicy(branching, value_order, rng)
+        if nogoods is not None:
+            game = search_learning(game, nogoods, propagation, stats, strategies, policy, budget)
+        elif restarts:
+            game = search_with_restarts(game, policy, restarts, in_place, propagation, stats, strategies,
+                                        budget=budget, table=table)
+        elif in_place:
+            game = search_in_place(game, propagation, stats, strategies, policy, budget, table)
+        else:
+            game = search(game, propagation=propagation, stats=stats, strategies=strategies, policy=policy,
+                          budget=budget)
+    except BudgetExceeded as e:
+        game.apply_constraint(strategies, propagation)
+        return SolveResult(e.status, game, stats)
+    return _result(game if game and game.is_solved() else None, stats)
+
+
+def _result(solution: Optional[Sudoku], stats: Optional[SolveStats]) -> SolveResult:
+    return SolveResult(SolveStatus.SOLVED if solution else SolveStatus.UNSOLVABLE, solution, stats)
 
 
 if __name__ == '__main__':
     diag_sudoku_grid = '2.............62....1....7...6..8...3...9...7...6..4...4....8....52.............3'
     #diag_sudoku_grid = "1..92....524.1...........7..5...81.2.........4.27...9..6...........3.945....71..6"
-    solution = solve(diag_sudoku_grid, use_diagonal=True)
+    solution = solve(diag_sudoku_grid, use_diagonal=True, record=True)
     if solution.is_valid():
         print("Solved Sudoku: ")
         solution.display()
@@ -0,0 +1,87 @@
+import sqlite3
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from unit_builder import ALL_UNITS, NOT_DIAGONAL_UNITS
+from canonical import canonical_form, invert_transform
+from solution import Sudoku, solve
+
+NO_SOLUTION = ''
+
+
+class SolutionCache(object):
+    """Solutions keyed by canonical puzzle: a bounded in-memory LRU in front of an optional sqlite file.
+       Unsolvable puzzles are cached too, as NO_SOLUTION"""
+    def __init__(self, max_entries=100000, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.db: Optional[sqlite3.Connection] = None
+        if path:
+            self.db = sqlite3.connect(path)
+            self.db.execute('CREATE TABLE IF NOT EXISTS solutions (puzzle TEXT PRIMARY KEY, solution TEXT)')
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if self.db is not None:
+            row = self.db.execute('SELECT solution FROM solutions WHERE puzzle = ?', (key,)).fetchone()
+            if row is not None:
+                self.disk_hits += 1
+                self._remember(key, row[0])
+                return row[0]
+        self.misses += 1
+        return None
+
+    def put(self, key: str, solution: str):
+        self._remember(key, solution)
+        if self.db is not None:
+            with self.db:
+                self.db.execute('INSERT OR REPLACE INTO solutions VALUES (?, ?)', (key, solution))
+
+    def _remember(self, key: str, solution: str):
+        self.entries[key] = solution
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'entries': len(self.entries)}
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+def cached_solve(grid: str, use_diagonal=False, cache: Optional[SolutionCache] = None, **kwargs) -> Optional[Sudoku]:
+    """
+    Same as solution.solve, but the solution of every puzzle equivalent to grid is looked up first.
+    Args:
+        grid(string): a string representing a sudoku grid
+        use_diagonal: If true it will enforce a diagonal sudoku
+        cache: the cache to use, DEFAULT_CACHE when it is None
+        kwargs: passed to solution.solve on a miss. Budgets are not accepted, a solve stopped by one must
+            not be cached: use solution.solve_with_budget without the cache
+    Returns:
+        The solved Sudoku in the orientation of grid, None if no solution exists.
+    """
+    cache = DEFAULT_CACHE if cache is None else cache
+    canonical, transform = canonical_form(grid, use_diagonal)
+    key = ('d:' if use_diagonal else 'n:') + canonical
+    solution = cache.get(key)
+    if solution is None:
+        game = solve(canonical, use_diagonal, **kwargs)
+        solution = str(game) if game else NO_SOLUTION
+        cache.put(key, solution)
+    if solution == NO_SOLUTION:
+        return None
+    return Sudoku(invert_transform(solution, transform), units=ALL_UNITS if use_diagonal else NOT_DIAGONAL_UNITS)
+
+
+DEFAULT_CACHE = SolutionCache()
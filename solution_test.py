@@ -1,7 +1,38 @@
+import asyncio
+import os
 import solution
+from collections import Counter
+import random
+import tempfile
 import unittest
 
+import batch
+import benchmark
+import branching
+import budget
+import canonical
+import generator
+import instrumentation
+import nogoods
+import parallel
+import puzzle_io
+import service
+import solution_cache
+import transposition
+
+try:
+    import vectorized
+except ImportError:
+    vectorized = None
+
+try:
+    import replay
+except ImportError:
+    replay = None
+
 import strategies
+import unit_builder
+import wire
 
 
 class TestNakedTwins(unittest.TestCase):
@@ -88,6 +119,45 @@ class TestNakedTwins(unittest.TestCase):
                         "Your naked_twins function produced an unexpected board.")
 
 
+class TestAdvancedStrategies(unittest.TestCase):
+    def empty(self):
+        return solution.Sudoku('.' * 81, unit_builder.NOT_DIAGONAL_UNITS)
+
+    def test_locked_candidates(self):
+        sudoku = self.empty()
+        for box in ['B1', 'B2', 'B3', 'C1', 'C2', 'C3']:
+            sudoku.set_box_value(tuple(box), set('23456789'))
+        strategies.locked_candidates(sudoku, sudoku.index.unit_cells[18])
+        self.assertEqual(sudoku.get_box_value(('A', '9')), set('23456789'))
+        self.assertEqual(sudoku.get_box_value(('A', '1')), set('123456789'))
+        self.assertEqual(sudoku.get_box_value(('B', '9')), set('123456789'))
+
+    def test_hidden_pairs(self):
+        sudoku = self.empty()
+        for c in '3456789':
+            sudoku.set_box_value(('A', c), set('3456789'))
+        self.assertEqual(strategies.hidden_pairs(sudoku, sudoku.index.unit_cells[0]), unit_builder.ValueResult.OK)
+        self.assertEqual(sudoku.get_box_value(('A', '1')), {'1', '2'})
+
+    def test_x_wing(self):
+        sudoku = self.empty()
+        for r in 'AE':
+            for c in '2346789':
+                sudoku.set_box_value((r, c), set('23456789'))
+        strategies.x_wing(sudoku, sudoku.index.unit_cells[0])
+        self.assertEqual(sudoku.get_box_value(('C', '5')), set('23456789'))
+        self.assertEqual(sudoku.get_box_value(('C', '4')), set('123456789'))
+
+    def test_same_solutions_fewer_nodes(self):
+        for corpus in ('minimal', 'unsolvable'):
+            for grid in benchmark.CORPORA[corpus]:
+                base, advanced = instrumentation.SolveStats(), instrumentation.SolveStats()
+                expected = solution.solve(grid, stats=base)
+                game = solution.solve(grid, stats=advanced, strategies=strategies.CONSTRAINTS + strategies.ADVANCED)
+                self.assertEqual(str(game), str(expected))
+                self.assertLessEqual(advanced.nodes, base.nodes)
+
+
 class TestDiagonalSudoku(unittest.TestCase):
     diagonal_grid = '2.............62....1....7...6..8...3...9...7...6..4...4....8....52.............3'
     solved_diag_sudoku = {'G7': '8', 'G6': '9', 'G5': '7', 'G4': '3', 'G3': '2', 'G2': '4', 'G1': '6', 'G9': '5',
@@ -106,6 +176,99 @@ class TestDiagonalSudoku(unittest.TestCase):
         solved = solution.convert_board(solution.solve(self.diagonal_grid, use_diagonal=True).board, reverse=True)
         self.assertEqual(solved, self.solved_diag_sudoku)
 
+    def test_history_is_opt_in(self):
+        self.assertEqual(solution.solve(self.diagonal_grid, use_diagonal=True).assignments, [])
+        for in_place in (True, False):
+            solved = solution.solve(self.diagonal_grid, use_diagonal=True, in_place=in_place, record=True)
+            self.assertEqual(solved.assignments[-1], self.solved_diag_sudoku)
+
+    def test_assignments_keyword(self):
+        earlier = solution.Sudoku(self.diagonal_grid, record=True).assignments + [{'A1': '2'}]
+        game = solution.Sudoku(self.diagonal_grid, assignments=earlier)
+        game.set_box_value(('A', '2'), {'7'})
+        self.assertEqual(game.assignments[0], {'A1': '2'})
+        self.assertEqual(len(game.assignments), 2)
+        self.assertEqual(game.copy().assignments, game.assignments)
+
+
+class TestBitBoard(unittest.TestCase):
+    grid = '2.............62....1....7...6..8...3...9...7...6..4...4....8....52.............3'
+
+    def test_string_round_trip(self):
+        self.assertEqual(str(solution.Sudoku(self.grid)), self.grid)
+
+    def test_board_round_trip(self):
+        board = solution.convert_board(TestNakedTwins.before_naked_twins_1)
+        sudoku = solution.Sudoku(board)
+        self.assertEqual(solution.convert_board(sudoku.board, reverse=True), TestNakedTwins.before_naked_twins_1)
+
+    def test_copy_is_independent(self):
+        sudoku = solution.Sudoku(self.grid)
+        other = sudoku.copy()
+        other.set_box_value(('A', '2'), {'1', '3'})
+        self.assertEqual(sudoku.get_box_value(('A', '2')), set('123456789'))
+        self.assertEqual(other.get_box_value(('A', '2')), {'1', '3'})
+
+    def test_validity_counters_follow_changes(self):
+        sudoku = solution.Sudoku(self.grid)
+        sudoku.trail = []
+        checkpoint = sudoku.checkpoint()
+        self.assertEqual(sudoku.set_box_value(('A', '2'), {'9'}), unit_builder.ValueResult.OK)
+        self.assertEqual(sudoku.set_box_value(('A', '3'), {'9'}), unit_builder.ValueResult.ERROR)
+        self.assertFalse(sudoku.is_viable())
+        self.assertEqual(sudoku.assigned, 81 - self.grid.count('.') + 2)
+        sudoku.undo(checkpoint)
+        self.assertTrue(sudoku.is_viable())
+        fresh = solution.Sudoku(self.grid)
+        self.assertEqual((sudoku.counts, sudoku.assigned, sudoku.conflicts, sudoku.empty),
+                         (fresh.counts, fresh.assigned, fresh.conflicts, fresh.empty))
+        self.assertFalse(solution.Sudoku('11' + '.' * 79).is_viable())
+
+
+class TestUnitIndex(unittest.TestCase):
+    def test_peers(self):
+        index = unit_builder.unit_index(unit_builder.NOT_DIAGONAL_UNITS)
+        self.assertEqual(len(index.box_peers[('E', '5')]), 20)
+        self.assertEqual(len(index.box_units[('A', '1')]), 3)
+
+    def test_diagonal_peers(self):
+        index = unit_builder.unit_index(unit_builder.ALL_UNITS)
+        self.assertEqual(len(index.box_peers[('E', '5')]), 32)
+        self.assertEqual(len(index.box_units[('E', '5')]), 5)
+        self.assertIs(index, unit_builder.ALL_INDEX)
+
+
+class TestBoardSizes(unittest.TestCase):
+    @staticmethod
+    def puzzle(n, blanks):
+        """A patterned complete grid of n*n by n*n with every k-th box emptied"""
+        layout = unit_builder.geometry(n)
+        size = n * n
+        grid = [layout.digits[(n * (r % n) + r // n + c) % size] for r in range(size) for c in range(size)]
+        return "".join('.' if (ix * 7) % blanks == 0 else v for ix, v in enumerate(grid))
+
+    def test_geometry(self):
+        layout = unit_builder.geometry(4)
+        self.assertIs(layout, unit_builder.geometry_of(256))
+        self.assertEqual(layout.digits, '123456789ABCDEFG')
+        self.assertEqual(len(layout.all_units), 50)
+        self.assertEqual(layout.box_units[1][:5], (('A', '5'), ('A', '6'), ('A', '7'), ('A', '8'), ('B', '5')))
+        index = unit_builder.unit_index(layout.not_diagonal_units)
+        self.assertEqual(len(index.box_peers[('P', '16')]), 39)
+        self.assertRaises(ValueError, unit_builder.geometry_of, 100)
+
+    def test_solve_larger_boards(self):
+        for n, blanks in [(2, 2), (4, 2), (5, 3)]:
+            grid = self.puzzle(n, blanks)
+            for backend in unit_builder.Backend:
+                game = solution.solve(grid, backend=backend)
+                self.assertTrue(game.is_solved())
+                self.assertTrue(all(g == '.' or g == v for g, v in zip(grid, str(game))))
+
+    def test_wrong_size(self):
+        self.assertRaises(ValueError, solution.Sudoku, '.' * 80, unit_builder.NOT_DIAGONAL_UNITS)
+        self.assertRaises(ValueError, solution.Sudoku, '.' * 256, unit_builder.NOT_DIAGONAL_UNITS)
+
 
 class EulerSudokus(unittest.TestCase):
     boards = ["..3.2.6..9..3.5..1..18.64....81.29..7.......8..67.82....26.95..8..2.3..9..5.1.3..",
@@ -166,6 +329,550 @@ class EulerSudokus(unittest.TestCase):
                 print("Fail: ", board)
             self.assertTrue(solved.is_solved())
 
+    def test_in_place_search_agrees(self):
+        for board in self.boards:
+            self.assertEqual(str(solution.solve(board, in_place=True)), str(solution.solve(board, in_place=False)))
+
+    def test_propagation_modes_agree(self):
+        for board in self.boards[:10]:
+            queue = solution.solve(board, propagation=unit_builder.Propagation.QUEUE)
+            fixed_point = solution.solve(board, propagation=unit_builder.Propagation.FIXED_POINT)
+            self.assertEqual(str(queue), str(fixed_point))
+
+
+class TestBranching(unittest.TestCase):
+    grid = benchmark.CORPORA['minimal'][0]
+
+    def nodes(self, **kwargs):
+        stats = instrumentation.SolveStats()
+        game = solution.solve(self.grid, stats=stats, **kwargs)
+        self.assertEqual(str(game), str(solution.solve(self.grid)))
+        return stats.nodes
+
+    def test_policies_solve(self):
+        for box_order in unit_builder.Branching:
+            for value_order in unit_builder.ValueOrder:
+                self.nodes(branching=box_order, value_order=value_order)
+        self.assertEqual(self.nodes(in_place=False, branching=unit_builder.Branching.MRV_DEGREE),
+                         self.nodes(branching=unit_builder.Branching.MRV_DEGREE))
+
+    def test_seed_is_reproducible(self):
+        self.assertEqual(self.nodes(seed=7), self.nodes(seed=7))
+        self.assertGreater(len({self.nodes(seed=seed) for seed in range(4)}), 1)
+
+    def test_restarts(self):
+        stats = instrumentation.SolveStats()
+        policy = branching.BranchingPolicy(rng=random.Random(1))
+        game = solution.Sudoku(self.grid, unit_builder.NOT_DIAGONAL_UNITS)
+        game = solution.search_with_restarts(game, policy, 3, stats=stats, restart_nodes=1)
+        self.assertEqual(stats.restarts, 3)
+        self.assertEqual(str(game), str(solution.solve(self.grid)))
+
+
+class TestBudget(unittest.TestCase):
+    grid = benchmark.CORPORA['minimal'][0]
+    impossible = '.....5.8....6.1.43..........1.5........1.6...3.......553.....61........4.........'
+
+    def test_solved_and_unsolvable(self):
+        result = solution.solve_with_budget(self.grid, max_nodes=10000)
+        self.assertEqual(result.status, unit_builder.SolveStatus.SOLVED)
+        self.assertEqual(str(result.board), str(solution.solve(self.grid)))
+        self.assertGreater(result.stats.nodes, 0)
+        result = solution.solve_with_budget('11' + '.' * 79, max_nodes=10000)
+        self.assertEqual(result.status, unit_builder.SolveStatus.UNSOLVABLE)
+        self.assertIsNone(result.board)
+
+    def test_budget_exhausted_keeps_reduced_board(self):
+        for in_place in (True, False):
+            result = solution.solve_with_budget(self.impossible, max_nodes=20, in_place=in_place)
+            self.assertEqual(result.status, unit_builder.SolveStatus.BUDGET_EXHAUSTED)
+            self.assertTrue(result.board.is_viable())
+            self.assertLess(sum(result.board.masks.popcount[m] for m in result.board.cells), 81 * 9)
+            self.assertEqual(result.stats.nodes, 20)
+        result = solution.solve_with_budget(self.impossible, max_depth=2)
+        self.assertEqual(result.status, unit_builder.SolveStatus.BUDGET_EXHAUSTED)
+
+    def test_timeout_and_cancel(self):
+        result = solution.solve_with_budget(self.impossible, timeout=0.05)
+        self.assertEqual(result.status, unit_builder.SolveStatus.TIMEOUT)
+        token = budget.CancellationToken()
+        token.cancel()
+        result = solution.solve_with_budget(self.grid, cancel=token)
+        self.assertEqual(result.status, unit_builder.SolveStatus.CANCELLED)
+        self.assertTrue(result.board.is_viable())
+
+    def test_dlx_budget(self):
+        result = solution.solve_with_budget(self.grid, max_nodes=1, backend=unit_builder.Backend.DLX)
+        self.assertEqual(result.status, unit_builder.SolveStatus.BUDGET_EXHAUSTED)
+        result = solution.solve_with_budget(self.grid, max_nodes=10000, backend=unit_builder.Backend.DLX)
+        self.assertEqual(str(result.board), str(solution.solve(self.grid)))
+
+    def test_solve_takes_no_budget(self):
+        self.assertRaises(TypeError, solution.solve, self.grid, timeout=10)
+        self.assertRaises(TypeError, solution_cache.cached_solve, self.grid, True, solution_cache.SolutionCache(),
+                          timeout=10)
+
+
+class TestTranspositionTable(unittest.TestCase):
+    grid = benchmark.CORPORA['minimal'][0]
+
+    def test_key_follows_changes(self):
+        sudoku = solution.Sudoku(self.grid)
+        sudoku.trail = []
+        checkpoint = sudoku.checkpoint()
+        key = sudoku.key
+        sudoku.set_box_value(('A', '2'), {'9'})
+        sudoku.set_box_value(('B', '2'), {'5', '6'})
+        self.assertEqual(sudoku.key, solution.Sudoku(sudoku.cells[:]).key)
+        sudoku.undo(checkpoint)
+        self.assertEqual(sudoku.key, key)
+
+    def test_eviction(self):
+        table = transposition.TranspositionTable(2)
+        table.put(1, 0)
+        table.put(2, 1)
+        table.get(1)
+        table.put(3, 2)
+        self.assertEqual(sorted(table.entries), [1, 3])
+        table = transposition.TranspositionTable(2, transposition.Eviction.DEPTH)
+        table.put(1, 0)
+        table.put(2, 3)
+        table.put(3, 5)
+        table.put(4, 1)
+        self.assertEqual(sorted(table.entries), [1, 4])
+        self.assertEqual(table.evictions, 1)
+
+    def test_restarts_reuse_boards(self):
+        stats = instrumentation.SolveStats()
+        table = transposition.TranspositionTable()
+        game = solution.Sudoku(self.grid, unit_builder.NOT_DIAGONAL_UNITS)
+        policy = branching.BranchingPolicy(rng=random.Random(1))
+        game = solution.search_with_restarts(game, policy, 10, stats=stats, restart_nodes=4, table=table)
+        self.assertEqual(str(game), str(solution.solve(self.grid)))
+        self.assertGreater(stats.table_hits, 0)
+        self.assertEqual(solution.count_solutions('1234' + '.' * 77, limit=50, table=table), 50)
+
+    def test_reduced_board_of_a_hit_is_stored_dead(self):
+        grid = '...75.....8....2...2.....4..3.1....8.9.......8...69......3.2.............7......5'
+        game = solution.Sudoku(grid, unit_builder.NOT_DIAGONAL_UNITS)
+        reduced = game.copy()
+        reduced.apply_constraint(solution.CONSTRAINTS)
+        table = transposition.TranspositionTable()
+        table.put(game.key, 0, reduced.cells[:])
+        self.assertEqual(solution.count_solutions(game, limit=1, table=table), 0)
+        self.assertTrue(table.get(game.key).dead)
+        self.assertTrue(table.get(reduced.key).dead)
+
+    def test_capacity_must_be_positive(self):
+        self.assertRaises(ValueError, transposition.TranspositionTable, 0)
+
+
+class TestNogoods(unittest.TestCase):
+    def test_learning_search_agrees(self):
+        learned = 0
+        for grid in benchmark.CORPORA['minimal'] + benchmark.CORPORA['unsolvable']:
+            store = nogoods.NogoodStore(capacity=32)
+            expected = solution.solve(grid)
+            result = solution.solve_with_budget(grid, nogoods=store, max_nodes=100000)
+            self.assertEqual(str(result.board) if result.board else None, str(expected) if expected else None)
+            self.assertLessEqual(len(store), 32)
+            learned += store.learned
+        self.assertGreater(learned, 32)
+
+    def test_backjumps(self):
+        backjumps = 0
+        for grid in benchmark.CORPORA['unsolvable']:
+            store = nogoods.NogoodStore()
+            self.assertIsNone(solution.search_learning(solution.Sudoku(grid, unit_builder.NOT_DIAGONAL_UNITS), store))
+            backjumps += store.backjumps
+        self.assertGreater(backjumps, 0)
+
+    def test_blocks(self):
+        store = nogoods.NogoodStore(max_size=2)
+        store.add([(0, 1), (1, 2)])
+        store.add([(0, 1), (1, 2), (2, 4)])
+        self.assertEqual(len(store), 1)
+        self.assertTrue(store.blocks(solution.array('H', [0, 2]), 0, 1))
+        self.assertFalse(store.blocks(solution.array('H', [0, 6]), 0, 1))
+
+
+class TestBatch(unittest.TestCase):
+    boards = EulerSudokus.boards[:12] + ['11' + '.' * 79]
+
+    def test_ordered(self):
+        results = list(batch.solve_batch(self.boards, workers=2, chunksize=3))
+        self.assertEqual([r.index for r in results], list(range(len(self.boards))))
+        self.assertEqual([r.solution for r in results], [str(solution.solve(b)) if solution.solve(b) else None
+                                                         for b in self.boards])
+        self.assertEqual(results[-1].error, 'unsolvable')
+
+    def test_unordered(self):
+        results = list(batch.solve_batch(self.boards, workers=2, chunksize=2, ordered=False))
+        self.assertEqual(sorted(r.index for r in results), list(range(len(self.boards))))
+
+
+class TestParallelSearch(unittest.TestCase):
+    def test_split_frontier(self):
+        grid = benchmark.CORPORA['minimal'][0]
+        game = solution.Sudoku(grid, unit_builder.NOT_DIAGONAL_UNITS)
+        frontier, solutions = parallel.split_frontier(game, 2, strategies.CONSTRAINTS, branching.DEFAULT_POLICY, 1)
+        self.assertGreaterEqual(len(frontier), 2)
+        self.assertEqual(solutions, [])
+        self.assertEqual(game.cells, solution.Sudoku(grid, unit_builder.NOT_DIAGONAL_UNITS).cells)
+
+    def test_solve_and_count(self):
+        with parallel.ParallelSearch(workers=2, frontier_depth=2) as search:
+            for grid in benchmark.CORPORA['minimal'][:2] + benchmark.CORPORA['unsolvable'][1:2]:
+                self.assertEqual(str(search.solve(grid)), str(solution.solve(grid)))
+            stats = instrumentation.SolveStats()
+            self.assertEqual(search.count_solutions(benchmark.CORPORA['diagonal'][3], 5, stats=stats), 5)
+            self.assertGreater(stats.nodes, 1)
+            self.assertEqual(search.count_solutions(benchmark.CORPORA['unsolvable'][1]), 0)
+
+
+class TestService(unittest.TestCase):
+    easy = benchmark.CORPORA['easy']
+    impossible = '.....5.8....6.1.43..........1.5........1.6...3.......553.....61........4.........'
+
+    def run_service(self, test, **kwargs):
+        async def run():
+            solver = service.SolveService(workers=1, **kwargs)
+            await solver.start()
+            try:
+                return await test(solver)
+            finally:
+                await solver.close()
+        return asyncio.run(run())
+
+    def test_coalescing_and_backpressure(self):
+        async def test(solver):
+            return await asyncio.gather(solver.solve(self.easy[0]), solver.solve(self.easy[0]),
+                                        solver.solve(self.easy[1]))
+        first, second, third = self.run_service(test, queue_size=1)
+        self.assertEqual((first['status'], second['status'], third['status']),
+                         (service.SOLVED, service.SOLVED, service.BUSY))
+        self.assertEqual(first['solution'], second['solution'])
+        self.assertTrue(second['coalesced'])
+
+    def test_timeout_stops_the_search(self):
+        async def test(solver):
+            slow = await solver.solve(self.impossible, timeout=0.1)
+            fast = await solver.solve(self.easy[0], timeout=5)
+            return slow, fast
+        slow, fast = self.run_service(test)
+        self.assertEqual(slow['status'], service.TIMEOUT)
+        self.assertEqual(fast['status'], service.SOLVED)
+        self.assertLess(fast['seconds'], 2)
+
+    def test_http(self):
+        async def test(solver):
+            server = await asyncio.start_server(solver.handle, '127.0.0.1', 0)
+            async with server:
+                port = server.sockets[0].getsockname()[1]
+                report = await service.load_test(self.easy[:3], port=port, concurrency=3, requests=9)
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                invalid = await service.request(reader, writer, '123')
+                writer.close()
+            return report, invalid
+        report, invalid = self.run_service(test)
+        self.assertEqual(report['statuses'], {service.SOLVED: 9})
+        self.assertEqual((invalid['status'], invalid['http_status']), (service.INVALID, 400))
+
+    def test_invalid_characters_and_requests(self):
+        self.assertEqual(service.solve_until('x' * 81, False, float('inf')), (service.INVALID, None))
+        self.assertEqual(service.solve_until('0' * 81, False, float('inf'))[0], service.SOLVED)
+
+        async def test(solver):
+            server = await asyncio.start_server(solver.handle, '127.0.0.1', 0)
+            async with server:
+                reader, writer = await asyncio.open_connection('127.0.0.1', server.sockets[0].getsockname()[1])
+                writer.write(b'GARBAGE\r\n\r\n')
+                status = await reader.readline()
+                writer.close()
+            return status
+        self.assertTrue(self.run_service(test).startswith(b'HTTP/1.1 400'))
+
+
+class TestPuzzleIO(unittest.TestCase):
+    lines = ['# header comment',
+             'p1, 400000805030000000000700000020000060000080400000010000000603070500200000104000000 # 17 clues',
+             '',
+             EulerSudokus.boards[0]]
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(self.lines * 50) + '\n')
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_layouts(self):
+        first, second = list(puzzle_io.read_puzzles(self.path))[:2]
+        self.assertEqual(first.id, 'p1')
+        self.assertEqual(first.grid[:9], '4.....8.5')
+        self.assertEqual(puzzle_io.format_like(first, first.grid), self.lines[1])
+        self.assertEqual(second, puzzle_io.Puzzle(EulerSudokus.boards[0]))
+
+    def test_ranges_cover_the_file(self):
+        puzzles = list(puzzle_io.read_puzzles(self.path))
+        ranges = puzzle_io.split_ranges(self.path, 7)
+        self.assertEqual(len(ranges), 7)
+        ranged = [p for start, end in ranges for p in puzzle_io.read_range(self.path, start, end)]
+        self.assertEqual(ranged, puzzles)
+
+    def test_writer(self):
+        puzzles = list(puzzle_io.read_puzzles(self.path))
+        with tempfile.TemporaryFile('w+') as f:
+            with puzzle_io.PuzzleWriter(f, buffer_lines=7) as writer:
+                for puzzle in puzzles:
+                    writer.write(puzzle, puzzle.grid)
+            f.seek(0)
+            self.assertEqual(f.read().splitlines(), [line for line in self.lines * 50 if line[:1] not in '#'])
+
+
+@unittest.skipIf(vectorized is None, 'numpy is not installed')
+class TestVectorized(unittest.TestCase):
+    def test_solve_many(self):
+        boards = EulerSudokus.boards + ['11' + '.' * 79]
+        expected = [solution.solve(board) for board in boards]
+        self.assertEqual(vectorized.solve_many(boards), [str(s) if s else None for s in expected])
+
+    def test_diagonal(self):
+        solved = vectorized.solve_many([TestDiagonalSudoku.diagonal_grid], use_diagonal=True)[0]
+        self.assertEqual(solved, str(solution.solve(TestDiagonalSudoku.diagonal_grid, use_diagonal=True)))
+
+
+@unittest.skipIf(replay is None, 'pygame is not installed')
+class TestReplay(unittest.TestCase):
+    def test_only_changed_boxes_are_redrawn(self):
+        history = solution.solve(TestDiagonalSudoku.diagonal_grid, use_diagonal=True, record=True).assignments
+        renderer = replay.ReplayRenderer(headless=True)
+        self.assertEqual(len(renderer.draw(history[0])), 81)
+        for before, after in zip(history, history[1:]):
+            changed = sum(1 for box in before if (len(before[box]) == 1) != (len(after[box]) == 1) or
+                          len(after[box]) == 1 and before[box] != after[box])
+            self.assertEqual(len(renderer.draw(after)), changed)
+
+    def test_write_frames(self):
+        history = solution.solve(TestDiagonalSudoku.diagonal_grid, use_diagonal=True, record=True).assignments
+        with tempfile.TemporaryDirectory() as directory:
+            frames = replay.render_replay(history[:5], directory)
+            self.assertEqual(sorted(os.listdir(directory)), ['frame_%05d.png' % i for i in range(frames)])
+        renderer = replay.ReplayRenderer(headless=True)
+        with tempfile.TemporaryDirectory() as first, tempfile.TemporaryDirectory() as directory:
+            renderer.write_frames(history[:2], first)
+            self.assertEqual(renderer.write_frames(history[2:5], directory), 3)
+            self.assertEqual(sorted(os.listdir(directory)), ['frame_%05d.png' % i for i in range(3)])
+
+
+class TestWire(unittest.TestCase):
+    grid = EulerSudokus.boards[0]
+
+    def test_round_trip(self):
+        game = solution.Sudoku(self.grid, unit_builder.NOT_DIAGONAL_UNITS)
+        game.apply_constraint(strategies.CONSTRAINTS[:1])
+        data = game.to_bytes()
+        self.assertEqual(len(data), wire.HEADER_SIZE + 92)
+        self.assertEqual(solution.Sudoku.from_bytes(data).cells, game.cells)
+        givens = solution.Sudoku(self.grid).to_bytes(wire.WireForm.GIVENS)
+        self.assertEqual(len(givens), wire.HEADER_SIZE + 41)
+        self.assertEqual(str(solution.Sudoku.from_bytes(givens)), self.grid)
+
+    def test_bulk_and_views(self):
+        boards = [solution.Sudoku(grid).cells for grid in EulerSudokus.boards]
+        data = bytearray(wire.encode_many(boards))
+        view = wire.BoardView(memoryview(data))
+        self.assertEqual(len(view), len(boards))
+        self.assertIs(view.record(-1).obj, data)
+        self.assertEqual(list(view), boards)
+        self.assertEqual(wire.decode_many(bytes(data)), boards)
+        self.assertRaises(ValueError, wire.BoardView, data[:-1])
+        self.assertRaises(ValueError, solution.Sudoku.from_bytes, data)
+
+    def test_larger_boards(self):
+        grid = TestBoardSizes.puzzle(4, 120)
+        for form in wire.WireForm:
+            self.assertEqual(str(solution.Sudoku.from_bytes(solution.Sudoku(grid).to_bytes(form))), grid)
+
+
+class TestSolutionCache(unittest.TestCase):
+    grid = EulerSudokus.boards[3]
+    relabeled = canonical.Transform(True, (5, 3, 4, 8, 6, 7, 1, 0, 2), (2, 1, 0, 3, 5, 4, 7, 8, 6), '528134769')
+
+    def assertSolves(self, game, grid):
+        self.assertTrue(game.is_solved())
+        self.assertTrue(all(g in '.' + s for g, s in zip(grid, str(game))))
+
+    def test_equivalent_puzzles_share_canonical_form(self):
+        other = canonical.apply_transform(self.grid, self.relabeled)
+        self.assertNotEqual(other, self.grid)
+        self.assertEqual(canonical.canonical_form(other)[0], canonical.canonical_form(self.grid)[0])
+
+    def test_tied_grids_share_canonical_form(self):
+        rng = random.Random(3)
+
+        def order():
+            return tuple(3 * band + i for band in rng.sample(range(3), 3) for i in rng.sample(range(3), 3))
+
+        solved = str(solution.solve(self.grid))
+        one_per_line = ''.join('.' * i + str(i + 1) + '.' * (8 - i) for i in (0, 3, 6, 1, 4, 7, 2, 5, 8))
+        for grid in (solved, one_per_line):
+            form = canonical.canonical_form(grid)[0]
+            for _ in range(4):
+                relabel = ''.join(rng.sample('123456789', 9))
+                transform = canonical.Transform(rng.random() < 0.5, order(), order(), relabel)
+                other = canonical.apply_transform(grid, transform)
+                self.assertEqual(canonical.canonical_form(other)[0], form)
+
+    def test_hits_are_mapped_back(self):
+        cache = solution_cache.SolutionCache(max_entries=4)
+        other = canonical.apply_transform(self.grid, self.relabeled)
+        self.assertSolves(solution_cache.cached_solve(self.grid, cache=cache), self.grid)
+        self.assertSolves(solution_cache.cached_solve(other, cache=cache), other)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertIsNone(solution_cache.cached_solve('11' + '.' * 79, cache=cache))
+
+    def test_diagonal_symmetries(self):
+        grid = TestDiagonalSudoku.diagonal_grid
+        cache = solution_cache.SolutionCache()
+        for transpose, rows, cols in canonical.DIAGONAL_SYMMETRIES[::7]:
+            other = canonical.apply_transform(grid, canonical.Transform(transpose, rows, cols, '931825746'))
+            self.assertEqual(canonical.canonical_form(other, True)[0], canonical.canonical_form(grid, True)[0])
+            game = solution_cache.cached_solve(other, use_diagonal=True, cache=cache)
+            self.assertSolves(game, other)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_disk_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'solutions.db')
+            first = solution_cache.SolutionCache(path=path)
+            solution_cache.cached_solve(self.grid, cache=first)
+            first.close()
+            second = solution_cache.SolutionCache(path=path)
+            self.assertSolves(solution_cache.cached_solve(self.grid, cache=second), self.grid)
+            self.assertEqual(second.stats()['disk_hits'], 1)
+            second.close()
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_run_case(self):
+        result = benchmark.run_case(benchmark.CORPORA['unsolvable'][:1] + benchmark.CORPORA['easy'][:2], False, 1)
+        self.assertEqual((result['puzzles'], result['solved']), (3, 2))
+        self.assertGreater(result['nodes_per_puzzle'], 0)
+
+    def test_regressions(self):
+        baseline = {'results': {'easy/standard': {'puzzles_per_second': 100.0, 'p99_ms': 10.0}}}
+        current = {'results': {'easy/standard': {'puzzles_per_second': 80.0, 'p99_ms': 10.5}}}
+        self.assertEqual(len(benchmark.regressions(current, baseline, 0.1)), 1)
+        self.assertEqual(benchmark.regressions(current, baseline, 0.25), [])
+
+    def test_compare_strategies(self):
+        report = benchmark.compare_strategies(benchmark.CORPORA['minimal'][:2], False)
+        self.assertEqual(set(report), {'baseline', 'all'} | {s.__name__ for s in strategies.ADVANCED})
+        self.assertEqual(report['baseline']['node_reduction'], 0)
+        self.assertGreater(report['locked_candidates']['node_reduction'], 0)
+
+    def test_compare_branching(self):
+        report = benchmark.compare_branching(benchmark.CORPORA['hard'][:2], False, seeds=2)
+        self.assertEqual(set(report), set(benchmark.POLICIES))
+        self.assertEqual(report['mrv']['nodes_per_puzzle_min'], report['mrv']['nodes_per_puzzle_max'])
+
+
+class TestInstrumentation(unittest.TestCase):
+    grid = benchmark.CORPORA['hard'][0]
+
+    def test_counters(self):
+        events = Counter()
+        stats = instrumentation.SolveStats([lambda event, data: events.update([event])])
+        solution.solve(self.grid, stats=stats)
+        self.assertEqual(stats.solves, 1)
+        self.assertEqual(events['node'], stats.nodes)
+        self.assertGreater(stats.nodes, stats.backtracks)
+        self.assertEqual(set(stats.strategy_calls), {'eliminate', 'only_choice', 'naked_twins'})
+        self.assertEqual(sum(stats.strategy_results.values()), sum(stats.strategy_calls.values()))
+
+    def test_copy_search_counts_the_same_tree(self):
+        in_place, copying = instrumentation.SolveStats(), instrumentation.SolveStats()
+        solution.solve(self.grid, stats=in_place)
+        solution.solve(self.grid, in_place=False, stats=copying)
+        self.assertEqual((in_place.nodes, in_place.backtracks), (copying.nodes, copying.backtracks))
+
+    def test_aggregate_and_export(self):
+        results = list(batch.solve_batch(EulerSudokus.boards[:4], workers=0, collect_stats=True))
+        total = batch.aggregate_stats(results)
+        self.assertEqual(total.solves, 4)
+        self.assertEqual(instrumentation.SolveStats.from_dict(total.as_dict()).as_dict(), total.as_dict())
+        self.assertIn('sudoku_search_nodes_total %d' % total.nodes, total.to_prometheus().splitlines())
+
+
+class TestDancingLinks(unittest.TestCase):
+    def test_same_solutions(self):
+        for board in EulerSudokus.boards + benchmark.CORPORA['hard'] + benchmark.CORPORA['unsolvable']:
+            expected = solution.solve(board)
+            found = solution.solve(board, backend=unit_builder.Backend.DLX)
+            self.assertEqual(str(found) if found else None, str(expected) if expected else None)
+
+    def test_diagonal(self):
+        found = solution.solve(TestDiagonalSudoku.diagonal_grid, use_diagonal=True, backend=unit_builder.Backend.DLX)
+        self.assertEqual(solution.convert_board(found.board, reverse=True), TestDiagonalSudoku.solved_diag_sudoku)
+        self.assertTrue(found.is_solved())
+
+
+class TestCountSolutions(unittest.TestCase):
+    def test_unique(self):
+        for board in benchmark.CORPORA['hard'] + benchmark.CORPORA['minimal']:
+            self.assertTrue(solution.has_unique_solution(board))
+        self.assertTrue(solution.has_unique_solution(TestDiagonalSudoku.diagonal_grid, use_diagonal=True))
+
+    def test_limit(self):
+        empty = '.' * 81
+        self.assertEqual(solution.count_solutions(empty, limit=5), 5)
+        several = benchmark.CORPORA['diagonal'][3]
+        self.assertEqual(solution.count_solutions(several, limit=1000), 36)
+        self.assertEqual(solution.count_solutions(several, limit=1000,
+                                                  propagation=unit_builder.Propagation.FIXED_POINT), 36)
+        self.assertEqual(solution.count_solutions(several, limit=10), 10)
+        self.assertFalse(solution.has_unique_solution(empty))
+
+    def test_unsolvable(self):
+        for board in benchmark.CORPORA['unsolvable']:
+            self.assertEqual(solution.count_solutions(board), 0)
+
+    def test_sudoku_is_not_changed(self):
+        game = solution.Sudoku(EulerSudokus.boards[0], units=unit_builder.NOT_DIAGONAL_UNITS)
+        before = str(game)
+        self.assertEqual(solution.count_solutions(game), 1)
+        self.assertEqual(str(game), before)
+
+
+class TestGenerator(unittest.TestCase):
+    def test_unique_and_seeded(self):
+        puzzles = list(generator.generate_many(2, seed=3, workers=0))
+        for puzzle in puzzles:
+            self.assertTrue(solution.has_unique_solution(puzzle.grid))
+            self.assertEqual(str(solution.solve(puzzle.grid)), puzzle.solution)
+            self.assertIn(puzzle.grade, generator.GRADES)
+        self.assertEqual(generator.generate(4), puzzles[1])
+
+    def test_diagonal(self):
+        puzzle = generator.generate(1, use_diagonal=True, min_clues=30)
+        self.assertGreaterEqual(puzzle.clues, 30)
+        self.assertTrue(solution.has_unique_solution(puzzle.grid, use_diagonal=True))
+        self.assertTrue(solution.Sudoku(puzzle.solution).is_solved())
+
+    def test_release_box_is_undone(self):
+        solved = solution.Sudoku(str(solution.solve(TestBitBoard.grid)), unit_builder.NOT_DIAGONAL_UNITS)
+        solved.trail = []
+        key, counts = solved.key, solved.counts[:]
+        checkpoint = solved.checkpoint()
+        solved.release_box(0, solved.masks.full_mask)
+        self.assertFalse(solved.is_solved())
+        self.assertEqual(solved.key, solution.Sudoku(solved.cells[:]).key)
+        solved.undo(checkpoint)
+        self.assertTrue(solved.is_solved())
+        self.assertEqual((solved.key, solved.counts), (key, counts))
+
 
 if __name__ == '__main__':
     # tests = TestNakedTwins()
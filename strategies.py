@@ -1,69 +1,259 @@
-from collections import Counter
-from typing import List, Set
+from itertools import combinations
+from typing import Dict, List
 
 from unit_builder import ValueResult
-from unit_builder import Unit, Board, Constraint
+from unit_builder import UnitCells, Constraint
 
 
-def eliminate(sudoku, unit: Unit) -> ValueResult:
+def eliminate(sudoku, unit: UnitCells) -> ValueResult:
     """Find the assigned values in the unit and remove the values from the options of all
        unassigned boxes in that unit"""
-    assigned = sudoku.get_assigned_values(unit)
+    cells = sudoku.cells
+    popcount = sudoku.masks.popcount
+    assigned = sudoku.get_assigned_mask(unit)
     changed = False
     error = False
     for box in unit:
-        if len(sudoku.get_box_value(box)) > 1:
-            old_v = sudoku.get_box_value(box)
-            store = sudoku.set_box_value(box, old_v - assigned)
+        old_v = cells[box]
+        if popcount[old_v] > 1:
+            store = sudoku.set_box_mask(box, old_v & ~assigned)
             changed = changed or store == ValueResult.OK
             error = error or store == ValueResult.ERROR
     return ValueResult.ERROR if error else ValueResult.OK if changed else ValueResult.UNCHANGED
 
 
-def only_choice(sudoku, unit: Unit) -> ValueResult:
+def only_choice(sudoku, unit: UnitCells) -> ValueResult:
     """Find the values that can be assigned to only one box in the unit and do it"""
-    assigned = sudoku.get_assigned_values(unit)
-    unassigned = sudoku.get_unassigned_values(unit)
-    counts = Counter(unassigned)
-    uniques = set([v for v, c in counts.items() if c == 1]) - assigned
+    cells = sudoku.cells
+    popcount = sudoku.masks.popcount
+    assigned = 0
+    once = 0
+    twice = 0
+    for box in unit:
+        m = cells[box]
+        if popcount[m] == 1:
+            assigned |= m
+        elif m:
+            twice |= once & m
+            once |= m
+    uniques = once & ~twice & ~assigned
     changed = False
     error = False
     if uniques:
         for box in unit:
-            if len(sudoku.get_box_value(box)) > 1:
-                old_v = sudoku.get_box_value(box)
+            old_v = cells[box]
+            if popcount[old_v] > 1:
                 new_v = old_v & uniques
-                store = sudoku.set_box_value(box, new_v if new_v else old_v)
+                store = sudoku.set_box_mask(box, new_v if new_v else old_v)
                 changed = changed or store == ValueResult.OK
                 error = error or store == ValueResult.ERROR
 
     return ValueResult.ERROR if error else ValueResult.OK if changed else ValueResult.UNCHANGED
 
 
-def naked_twins(sudoku, unit: Unit) -> ValueResult:
+def naked_twins(sudoku, unit: UnitCells) -> ValueResult:
     """Find pair of boxes with the same potential two values in a unit, and remove them of all other boxes in it"""
-    def find_twins(unit: Unit) -> List[Set[chr]]:
-        assigned = sudoku.get_assigned_values(unit)
-        unit_values = map(lambda b: tuple(sorted(list(sudoku.board[b]))), unit)
-        only_two = filter(lambda v: len(v) == 2, unit_values)
-        counts = Counter(only_two)
-        twins = [set(list(v)) for v, c in counts.items() if c > 1]
-        twins = list(filter(lambda t: len(t) == 2, map(lambda t: t - assigned, twins)))
-        return twins
-
-    twins = find_twins(unit)
+    def find_twins() -> List[int]:
+        assigned = sudoku.get_assigned_mask(unit)
+        seen = set()
+        twins = []
+        for box in unit:
+            m = cells[box]
+            if popcount[m] == 2:
+                if m in seen and m not in twins:
+                    twins.append(m)
+                seen.add(m)
+        return [t for t in twins if popcount[t & ~assigned] == 2]
+
+    cells = sudoku.cells
+    popcount = sudoku.masks.popcount
     changed = False
-    error = False
-    for twin in twins:
+    for twin in find_twins():
         for box in unit:
-            old_v = sudoku.board[box]
-            if len(old_v) > 2:
-                new_v = old_v - twin
-                store = sudoku.set_box_value(box, new_v if new_v else old_v)
+            old_v = cells[box]
+            if popcount[old_v] > 2:
+                new_v = old_v & ~twin
+                store = sudoku.set_box_mask(box, new_v if new_v else old_v)
                 changed = changed or store == ValueResult.OK
-                error = error or store == ValueResult.ERROR
 
     return ValueResult.OK if changed else ValueResult.UNCHANGED
 
 
-CONSTRAINTS: List[Constraint] = [eliminate, only_choice, naked_twins]
\ No newline at end of file
+def _result(changed: bool) -> ValueResult:
+    return ValueResult.OK if changed else ValueResult.UNCHANGED
+
+
+def _naked_subset(sudoku, unit: UnitCells, size: int) -> ValueResult:
+    """Find size boxes of a unit whose candidates are only size values and remove them from the other boxes"""
+    cells = sudoku.cells
+    popcount = sudoku.masks.popcount
+    open_boxes = [box for box in unit if 1 < popcount[cells[box]] <= size]
+    changed = False
+    for group in combinations(open_boxes, size):
+        values = 0
+        for box in group:
+            values |= cells[box]
+        if popcount[values] < size:
+            return ValueResult.ERROR
+        if popcount[values] > size:
+            continue
+        for box in unit:
+            old_v = cells[box]
+            if popcount[old_v] > 1 and old_v & values and box not in group:
+                if sudoku.set_box_mask(box, old_v & ~values) == ValueResult.ERROR:
+                    return ValueResult.ERROR
+                changed = True
+    return _result(changed)
+
+
+def _hidden_subset(sudoku, unit: UnitCells, size: int) -> ValueResult:
+    """Find size values that only fit in size boxes of a unit and remove every other value from those boxes"""
+    cells = sudoku.cells
+    popcount = sudoku.masks.popcount
+    mask_bits = sudoku.masks.mask_bits
+    assigned = 0
+    positions: Dict[int, int] = {}
+    for p, box in enumerate(unit):
+        m = cells[box]
+        if popcount[m] == 1:
+            assigned |= m
+        else:
+            for value in mask_bits[m]:
+                positions[value] = positions.get(value, 0) | 1 << p
+    candidates = [value for value, where in positions.items() if not value & assigned and popcount[where] <= size]
+    changed = False
+    for group in combinations(candidates, size):
+        values = 0
+        where = 0
+        for value in group:
+            values |= value
+            where |= positions[value]
+        if popcount[where] < size:
+            return ValueResult.ERROR
+        if popcount[where] > size:
+            continue
+        for p, box in enumerate(unit):
+            old_v = cells[box]
+            if where >> p & 1 and old_v & ~values:
+                if sudoku.set_box_mask(box, old_v & values) == ValueResult.ERROR:
+                    return ValueResult.ERROR
+                changed = True
+    return _result(changed)
+
+
+def naked_triples(sudoku, unit: UnitCells) -> ValueResult:
+    return _naked_subset(sudoku, unit, 3)
+
+
+def naked_quads(sudoku, unit: UnitCells) -> ValueResult:
+    return _naked_subset(sudoku, unit, 4)
+
+
+def hidden_pairs(sudoku, unit: UnitCells) -> ValueResult:
+    return _hidden_subset(sudoku, unit, 2)
+
+
+def hidden_triples(sudoku, unit: UnitCells) -> ValueResult:
+    return _hidden_subset(sudoku, unit, 3)
+
+
+def hidden_quads(sudoku, unit: UnitCells) -> ValueResult:
+    return _hidden_subset(sudoku, unit, 4)
+
+
+def locked_candidates(sudoku, unit: UnitCells) -> ValueResult:
+    """Pointing pairs and box/line reduction: when every box of a unit that can take a value lies in its
+       intersection with another unit, the value is removed from the rest of that other unit"""
+    cells = sudoku.cells
+    popcount = sudoku.masks.popcount
+    assigned = sudoku.get_assigned_mask(unit)
+    changed = False
+    for shared, rest, outside in sudoku.index.overlaps[sudoku.index.unit_numbers[unit]]:
+        inside = 0
+        for box in shared:
+            inside |= cells[box]
+        for box in rest:
+            inside &= ~cells[box]
+        locked = inside & ~assigned
+        if not locked:
+            continue
+        for box in outside:
+            old_v = cells[box]
+            if popcount[old_v] > 1 and old_v & locked:
+                if sudoku.set_box_mask(box, old_v & ~locked) == ValueResult.ERROR:
+                    return ValueResult.ERROR
+                changed = True
+    return _result(changed)
+
+
+def _fish(sudoku, unit: UnitCells, size: int) -> ValueResult:
+    """X-Wing (size 2) and Swordfish (size 3) with the unit as one of the base lines: when a value fits in
+       size parallel lines only at size positions, it is removed from those positions in the other lines"""
+    lines = sudoku.index.unit_lines[sudoku.index.unit_numbers[unit]]
+    if lines is None:
+        return ValueResult.UNCHANGED
+    lines, own = lines
+    cells = sudoku.cells
+    popcount = sudoku.masks.popcount
+    mask_bits = sudoku.masks.mask_bits
+    placed = 0
+    own_positions: Dict[int, int] = {}
+    for p, box in enumerate(unit):
+        m = cells[box]
+        if popcount[m] == 1:
+            placed |= m
+        else:
+            for value in mask_bits[m]:
+                own_positions[value] = own_positions.get(value, 0) | 1 << p
+    bases = 0
+    for value, where in own_positions.items():
+        if not value & placed and 1 < popcount[where] <= size:
+            bases |= value
+    if not bases:
+        return ValueResult.UNCHANGED
+    # positions of the base values in every line, a line where the value is placed never takes part
+    positions: Dict[int, List[int]] = {value: [0] * len(lines) for value in mask_bits[bases]}
+    for k, line in enumerate(lines):
+        for p, box in enumerate(line):
+            m = cells[box] & bases
+            if m:
+                if popcount[cells[box]] == 1:
+                    positions[m][k] = -1
+                else:
+                    for value in mask_bits[m]:
+                        if positions[value][k] >= 0:
+                            positions[value][k] |= 1 << p
+    changed = False
+    for value, where in positions.items():
+        others = [k for k in range(len(lines)) if k != own and where[k] > 0 and 1 < popcount[where[k]] <= size]
+        for group in combinations(others, size - 1):
+            cover = where[own]
+            for k in group:
+                cover |= where[k]
+            if popcount[cover] != size:
+                continue
+            for k, line in enumerate(lines):
+                if k == own or k in group:
+                    continue
+                for p, box in enumerate(line):
+                    old_v = cells[box]
+                    if cover >> p & 1 and old_v & value and popcount[old_v] > 1:
+                        if sudoku.set_box_mask(box, old_v & ~value) == ValueResult.ERROR:
+                            return ValueResult.ERROR
+                        changed = True
+    return _result(changed)
+
+
+def x_wing(sudoku, unit: UnitCells) -> ValueResult:
+    return _fish(sudoku, unit, 2)
+
+
+def swordfish(sudoku, unit: UnitCells) -> ValueResult:
+    return _fish(sudoku, unit, 3)
+
+
+CONSTRAINTS: List[Constraint] = [eliminate, only_choice, naked_twins]
+# Stronger deductions, cheapest first, to be added to CONSTRAINTS for a solve
+ADVANCED: List[Constraint] = [hidden_pairs, locked_candidates, naked_triples, hidden_triples, x_wing,
+                              naked_quads, hidden_quads, swordfish]
+STRATEGIES: Dict[str, Constraint] = {constraint.__name__: constraint for constraint in CONSTRAINTS + ADVANCED}
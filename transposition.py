@@ -0,0 +1,79 @@
+from collections import OrderedDict
+from enum import Enum
+from typing import Dict, NamedTuple, Optional
+
+from bitboard import Cells
+
+
+class Eviction(Enum):
+    LRU = 1
+    DEPTH = 2
+
+
+class Entry(NamedTuple):
+    depth: int
+    reduced: Optional[Cells]
+    dead: bool
+
+
+class TranspositionTable(object):
+    """
+    Remembers the boards met by the search, keyed by their Zobrist hash (Sudoku.key):
+      reduced: the board apply_constraint made of it, so reaching it again skips the propagation
+      dead: no solution is below it, so reaching it again prunes the branch
+    The key is the hash of the candidates only, a table must only be shared by searches over the same units.
+    When capacity entries are stored new ones evict, by eviction:
+      LRU: the entry looked up or stored least recently
+      DEPTH: the oldest of the deepest entries, those cut the smallest subtrees. A new entry deeper than all the
+             stored ones is not kept
+    """
+    def __init__(self, capacity=1 << 16, eviction: Eviction = Eviction.LRU):
+        if capacity < 1:
+            raise ValueError('a transposition table needs a capacity of at least 1, not %d' % capacity)
+        self.capacity = capacity
+        self.eviction = eviction
+        self.entries: Dict[int, Entry] = OrderedDict() if eviction == Eviction.LRU else {}
+        self.depths: Dict[int, Dict[int, None]] = {}
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key: int) -> Optional[Entry]:
+        entry = self.entries.get(key)
+        if entry is not None and self.eviction == Eviction.LRU:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: int, depth: int, reduced: Optional[Cells] = None, dead=False):
+        """Stores what is known about a board, adding to what was already known"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries[key] = Entry(entry.depth, reduced if reduced is not None else entry.reduced,
+                                      dead or entry.dead)
+            if self.eviction == Eviction.LRU:
+                self.entries.move_to_end(key)
+            return
+        if len(self.entries) >= self.capacity and not self._evict(depth):
+            return
+        self.entries[key] = Entry(depth, reduced, dead)
+        if self.eviction == Eviction.DEPTH:
+            self.depths.setdefault(depth, {})[key] = None
+
+    def _evict(self, depth: int) -> bool:
+        if self.eviction == Eviction.LRU:
+            self.entries.popitem(last=False)
+        else:
+            deepest = max(d for d, keys in self.depths.items() if keys)
+            if deepest < depth:
+                return False
+            keys = self.depths[deepest]
+            key = next(iter(keys))
+            del keys[key]
+            del self.entries[key]
+        self.evictions += 1
+        return True
+
+    def clear(self):
+        self.entries.clear()
+        self.depths.clear()
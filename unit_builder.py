@@ -1,5 +1,7 @@
-from itertools import groupby, chain
-from typing import Tuple, Set, Dict, Callable, List
+from functools import lru_cache
+from itertools import chain
+from math import isqrt
+from typing import Tuple, Set, Dict, Callable, List, FrozenSet, Optional
 from enum import Enum
 
 
@@ -8,51 +10,178 @@ class ValueResult(Enum):
     UNCHANGED = 2
     OK = 3
 
-RowCol = Tuple[chr, chr, chr, chr, chr, chr, chr, chr, chr]
-Box = Tuple[chr, chr]
-Unit = Tuple[Box, Box, Box,
-             Box, Box, Box,
-             Box, Box, Box]
+
+class Propagation(Enum):
+    QUEUE = 1
+    FIXED_POINT = 2
+
+
+class Backend(Enum):
+    PROPAGATE = 1
+    DLX = 2
+
+
+class Branching(Enum):
+    MRV = 1
+    MRV_DEGREE = 2
+
+
+class ValueOrder(Enum):
+    ASCENDING = 1
+    LEAST_CONSTRAINING = 2
+
+
+class SolveStatus(Enum):
+    SOLVED = 1
+    UNSOLVABLE = 2
+    TIMEOUT = 3
+    BUDGET_EXHAUSTED = 4
+    CANCELLED = 5
+
+RowCol = Tuple[str, ...]
+Box = Tuple[str, str]
+Unit = Tuple[Box, ...]
 Values = Set[chr]
 Board = Dict[Box, Values]
-Constraint = Callable[[any, Unit], Board]
-ROWS: RowCol = tuple(map(chr, range(ord('A'), ord('I')+1)))
-COLS: RowCol = tuple(map(chr, range(ord('1'), ord('9')+1)))
-BOX_VALUES: Values = set(COLS)
-ALL_BOXES: List[Box] = [tuple([r, c]) for r in ROWS for c in COLS]
-ROW_UNITS: List[Unit] = list(map(lambda g: tuple(g[1]), groupby(ALL_BOXES, lambda box: box[0])))
-COL_UNITS: List[Unit] = list(map(lambda g: tuple(g[1]), groupby(sorted(ALL_BOXES, key=lambda b: b[1]),
-                                                                lambda box: box[1])))
+UnitCells = Tuple[int, ...]
+Constraint = Callable[[any, UnitCells], 'ValueResult']
+ROW_NAMES = "".join(map(chr, range(ord('A'), ord('Z') + 1)))
+VALUE_ALPHABET = "123456789" + "".join(map(chr, range(ord('A'), ord('P') + 1)))
+
+
+class Geometry(object):
+    """Names and units of an n*n by n*n board (n=3 is the classic 9x9): rows are letters, columns are
+       numbers and the values are the first n*n characters of VALUE_ALPHABET ('1'..'9' then 'A'..'P')"""
+    def __init__(self, n: int):
+        size = n * n
+        if n < 2 or size > len(VALUE_ALPHABET):
+            raise ValueError('boards from 4x4 to %dx%d are supported' % (len(VALUE_ALPHABET), len(VALUE_ALPHABET)))
+        self.n = n
+        self.size = size
+        self.digits: str = VALUE_ALPHABET[:size]
+        self.rows: RowCol = tuple(ROW_NAMES[:size])
+        self.cols: RowCol = tuple(str(c) for c in range(1, size + 1))
+        self.boxes: List[Box] = [(r, c) for r in self.rows for c in self.cols]
+        self.box_index: Dict[Box, int] = {box: ix for ix, box in enumerate(self.boxes)}
+        self.row_units: List[Unit] = [tuple((r, c) for c in self.cols) for r in self.rows]
+        self.col_units: List[Unit] = [tuple((r, c) for r in self.rows) for c in self.cols]
+        self.box_units: List[Unit] = [tuple((self.rows[r], self.cols[c])
+                                            for r in range(band, band + n) for c in range(stack, stack + n))
+                                      for band in range(0, size, n) for stack in range(0, size, n)]
+        self.diagonal_units: List[Unit] = [tuple((self.rows[i], self.cols[i]) for i in range(size)),
+                                           tuple((self.rows[i], self.cols[size - 1 - i]) for i in range(size))]
+        self.not_diagonal_units: List[Unit] = list(chain(self.row_units, self.col_units, self.box_units))
+        self.all_units: List[Unit] = list(chain(self.not_diagonal_units, self.diagonal_units))
+
+    def units(self, use_diagonal=False) -> List[Unit]:
+        return self.all_units if use_diagonal else self.not_diagonal_units
+
+
+@lru_cache(maxsize=None)
+def geometry(n: int) -> Geometry:
+    """Returns the (cached) geometry of the boards with n*n by n*n boxes"""
+    return Geometry(n)
+
+
+def geometry_of(boxes: int) -> Geometry:
+    """Returns the geometry of the boards with that number of boxes, e.g. 81 or 256"""
+    n = isqrt(isqrt(boxes))
+    if n ** 4 != boxes:
+        raise ValueError('a board of %d boxes is not square' % boxes)
+    return geometry(n)
+
+
+STANDARD: Geometry = geometry(3)
+ROWS: RowCol = STANDARD.rows
+COLS: RowCol = STANDARD.cols
+BOX_VALUES: Values = set(STANDARD.digits)
+ALL_BOXES: List[Box] = STANDARD.boxes
+BOX_INDEX: Dict[Box, int] = STANDARD.box_index
+ROW_UNITS: List[Unit] = STANDARD.row_units
+COL_UNITS: List[Unit] = STANDARD.col_units
 
 
 def box_unit(box: Box) -> int:
-    return (1 if box[0] in ['A', 'B', 'C'] and box[1] in ['1', '2', '3'] else
-            2 if box[0] in ['A', 'B', 'C'] and box[1] in ['4', '5', '6'] else
-            3 if box[0] in ['A', 'B', 'C'] and box[1] in ['7', '8', '9'] else
-            4 if box[0] in ['D', 'E', 'F'] and box[1] in ['1', '2', '3'] else
-            5 if box[0] in ['D', 'E', 'F'] and box[1] in ['4', '5', '6'] else
-            6 if box[0] in ['D', 'E', 'F'] and box[1] in ['7', '8', '9'] else
-            7 if box[0] in ['G', 'H', 'I'] and box[1] in ['1', '2', '3'] else
-            8 if box[0] in ['G', 'H', 'I'] and box[1] in ['4', '5', '6'] else
-            9)
+    """The number (from 1) of the 3x3 square of a box of the standard board"""
+    return ROWS.index(box[0]) // 3 * 3 + COLS.index(box[1]) // 3 + 1
 
 
-BOX_UNITS: List[Unit] = list(map(lambda g: tuple(g[1]), groupby(sorted(ALL_BOXES, key=box_unit),
-                                                                box_unit)))
+BOX_UNITS: List[Unit] = STANDARD.box_units
 
 
 def diagonal_unit_1(box: Box) -> int:
-    return "".join(box) in ['A1', 'B2', 'C3', 'D4', 'E5', 'F6', 'G7', 'H8', 'I9']
+    return ROWS.index(box[0]) == COLS.index(box[1])
 
 
 def diagonal_unit_2(box: Box) -> int:
-    return "".join(box) in ['A9', 'B8', 'C7', 'D6', 'E5', 'F4', 'G3', 'H2', 'I1']
+    return ROWS.index(box[0]) + COLS.index(box[1]) == len(COLS) - 1
+
+
+DIAGONAL_UNITS: List[Unit] = STANDARD.diagonal_units
+NOT_DIAGONAL_UNITS: List[Unit] = STANDARD.not_diagonal_units
+ALL_UNITS: List[Unit] = STANDARD.all_units
+
+
+class UnitIndex(object):
+    """Membership tables for a unit configuration, boxes are addressed by name or by index in the boxes
+       of its geometry (ALL_BOXES for the standard board):
+         unit_cells: for every unit the indexes of its boxes
+         cell_units: for every box index the numbers of the units containing it
+         cell_peers: for every box index the indexes of the boxes sharing a unit with it
+         box_units / box_peers: the same relations keyed by box name
+         unit_numbers: the number of every unit keyed by its unit_cells
+         overlaps: for every unit, each other unit sharing two or more boxes with it as the tuple
+                   (shared boxes, rest of the unit, rest of the other unit)
+         unit_lines: for a row (column) unit all the rows (columns) in order and its position among them,
+                     None for the other units
+    """
+    def __init__(self, units: Tuple[Unit, ...]):
+        self.units: Tuple[Unit, ...] = units
+        self.geometry: Geometry = geometry(isqrt(len(units[0])))
+        boxes = self.geometry.boxes
+        box_index = self.geometry.box_index
+        self.unit_cells: Tuple[UnitCells, ...] = tuple(tuple(box_index[box] for box in unit) for unit in units)
+        self.cell_units: Tuple[Tuple[int, ...], ...] = tuple(
+            tuple(u for u, cells in enumerate(self.unit_cells) if ix in cells) for ix in range(len(boxes)))
+        self.cell_peers: Tuple[Tuple[int, ...], ...] = tuple(
+            tuple(sorted(set(chain(*[self.unit_cells[u] for u in self.cell_units[ix]])) - {ix}))
+            for ix in range(len(boxes)))
+        self.box_units: Dict[Box, List[Unit]] = {
+            box: [units[u] for u in self.cell_units[ix]] for ix, box in enumerate(boxes)}
+        self.box_peers: Dict[Box, FrozenSet[Box]] = {
+            box: frozenset(boxes[p] for p in self.cell_peers[ix]) for ix, box in enumerate(boxes)}
+        self.unit_numbers: Dict[UnitCells, int] = {cells: u for u, cells in enumerate(self.unit_cells)}
+        self.overlaps: Tuple[Tuple[Tuple[UnitCells, UnitCells, UnitCells], ...], ...] = tuple(
+            tuple(self._overlap(cells, other) for other in self.unit_cells
+                  if other is not cells and len(set(cells) & set(other)) > 1)
+            for cells in self.unit_cells)
+        self.unit_lines: List[Optional[Tuple[Tuple[UnitCells, ...], int]]] = [None] * len(units)
+        for kind in (self.geometry.row_units, self.geometry.col_units):
+            members = set(kind)
+            numbers = [u for u, unit in enumerate(units) if unit in members]
+            if len(numbers) == len(kind):
+                lines = tuple(self.unit_cells[u] for u in numbers)
+                for position, u in enumerate(numbers):
+                    self.unit_lines[u] = (lines, position)
+
+    @staticmethod
+    def _overlap(cells: UnitCells, other: UnitCells) -> Tuple[UnitCells, UnitCells, UnitCells]:
+        return (tuple(ix for ix in cells if ix in other), tuple(ix for ix in cells if ix not in other),
+                tuple(ix for ix in other if ix not in cells))
+
+
+@lru_cache(maxsize=None)
+def _cached_unit_index(units: Tuple[Unit, ...]) -> UnitIndex:
+    return UnitIndex(units)
+
+
+def unit_index(units: List[Unit]) -> UnitIndex:
+    """Returns the (cached) membership tables for a unit configuration"""
+    return _cached_unit_index(tuple(units))
 
 
-DIAGONAL_UNITS: List[Unit] = [tuple(filter(diagonal_unit_1, ALL_BOXES)),
-                              tuple(filter(diagonal_unit_2, ALL_BOXES))]
-NOT_DIAGONAL_UNITS: List[Unit] = list(chain(ROW_UNITS, COL_UNITS, BOX_UNITS))
-ALL_UNITS: List[Unit] = list(chain(NOT_DIAGONAL_UNITS, DIAGONAL_UNITS))
+NOT_DIAGONAL_INDEX: UnitIndex = unit_index(NOT_DIAGONAL_UNITS)
+ALL_INDEX: UnitIndex = unit_index(ALL_UNITS)
 
 
 def build_unit(ix: chr, other: RowCol, ix_first=True) -> Unit:
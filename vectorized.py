@@ -0,0 +1,158 @@
+from array import array
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from unit_builder import UnitIndex, NOT_DIAGONAL_INDEX, ALL_INDEX, ALL_UNITS, NOT_DIAGONAL_UNITS, ALL_BOXES
+from bitboard import DIGIT_MASK, FULL_MASK, POPCOUNT, CELL_TYPE
+from solution import Sudoku, search_in_place
+
+POPCOUNT_TABLE = np.array(POPCOUNT, dtype=np.uint8)
+_CHAR_MASK = np.full(256, FULL_MASK, dtype=np.uint16)
+for _digit, _mask in DIGIT_MASK.items():
+    _CHAR_MASK[ord(_digit)] = _mask
+
+
+class UnitArrays(object):
+    """The tables of a UnitIndex as index arrays:
+         unit_cells: (units, 9) box indexes of every unit
+         cell_units: (81, k) units of every box, padded with the extra unit number len(units)
+         cell_slots: (81, k) flat positions of every box in unit_cells, padded with len(units) * 9
+    """
+    def __init__(self, index: UnitIndex):
+        self.unit_cells = np.array(index.unit_cells, dtype=np.intp)
+        n_units, unit_size = self.unit_cells.shape
+        width = max(len(units) for units in index.cell_units)
+        self.cell_units = np.full((len(ALL_BOXES), width), n_units, dtype=np.intp)
+        self.cell_slots = np.full((len(ALL_BOXES), width), n_units * unit_size, dtype=np.intp)
+        for ix, units in enumerate(index.cell_units):
+            self.cell_units[ix, :len(units)] = units
+            self.cell_slots[ix, :len(units)] = [u * unit_size + index.unit_cells[u].index(ix) for u in units]
+
+
+@lru_cache(maxsize=None)
+def unit_arrays(index: UnitIndex) -> UnitArrays:
+    return UnitArrays(index)
+
+
+def encode(grids: Sequence[str]) -> np.ndarray:
+    """Candidate masks of N grids as an (N, 81) uint16 array"""
+    raw = np.frombuffer("".join(grids).encode('ascii'), dtype=np.uint8).reshape(len(grids), len(ALL_BOXES))
+    return _CHAR_MASK[raw]
+
+
+def decode(cands: np.ndarray) -> List[str]:
+    """The string form of every row of a candidate array, '.' for undecided boxes"""
+    digits = np.full(FULL_MASK + 1, ord('.'), dtype=np.uint8)
+    for digit, mask in DIGIT_MASK.items():
+        digits[mask] = ord(digit)
+    digits[0] = ord('*')
+    chars = digits[cands].tobytes().decode('ascii')
+    return [chars[i:i + len(ALL_BOXES)] for i in range(0, len(chars), len(ALL_BOXES))]
+
+
+def _per_cell(values: np.ndarray, tables: np.ndarray, pad: int) -> np.ndarray:
+    """Gathers a value per (box, unit containing the box) from (N, units) or (N, units * 9) values"""
+    padded = np.concatenate([values, np.full((values.shape[0], 1), pad, dtype=values.dtype)], axis=1)
+    return padded[:, tables]
+
+
+def propagate_round(cands: np.ndarray, arrays: UnitArrays, pairs=True) -> Tuple[np.ndarray, np.ndarray]:
+    """Applies elimination, hidden singles and naked pairs once to every puzzle.
+       Returns the new candidates and a boolean array marking the puzzles with a contradiction"""
+    n = cands.shape[0]
+    full = np.uint16(FULL_MASK)
+    single = POPCOUNT_TABLE[cands] == 1
+
+    # eliminate: remove the values assigned in the units of every undecided box
+    by_unit = np.where(single, cands, 0)[:, arrays.unit_cells]
+    assigned = np.bitwise_or.reduce(by_unit, axis=2)
+    peers_assigned = np.bitwise_or.reduce(_per_cell(assigned, arrays.cell_units, 0), axis=2)
+    cands = np.where(single, cands, cands & ~peers_assigned)
+
+    # only choice: a value that fits a single undecided box of a unit goes to that box
+    units = cands[:, arrays.unit_cells]
+    single_u = POPCOUNT_TABLE[units] == 1
+    assigned = np.bitwise_or.reduce(np.where(single_u, units, 0), axis=2)
+    single = POPCOUNT_TABLE[cands] == 1
+    once = np.zeros(assigned.shape, dtype=np.uint16)
+    twice = np.zeros(assigned.shape, dtype=np.uint16)
+    for k in range(units.shape[2]):
+        m = np.where(single_u[:, :, k], 0, units[:, :, k])
+        twice |= once & m
+        once |= m
+    uniques = once & ~twice & ~assigned
+    hits = units & uniques[:, :, None]
+    hits = np.where(hits != 0, hits, full).reshape(n, -1)
+    cands = np.where(single, cands,
+                     cands & np.bitwise_and.reduce(_per_cell(hits, arrays.cell_slots, full), axis=2))
+
+    # naked pairs: two boxes of a unit left with the same two values own them
+    if pairs:
+        units = cands[:, arrays.unit_cells]
+        is_pair = POPCOUNT_TABLE[units] == 2
+        twin = np.zeros(units.shape, dtype=bool)
+        for a in range(units.shape[2]):
+            for b in range(a + 1, units.shape[2]):
+                same = is_pair[:, :, a] & (units[:, :, a] == units[:, :, b])
+                twin[:, :, a] |= same
+                twin[:, :, b] |= same
+        twins = np.bitwise_or.reduce(np.where(twin, units, 0), axis=2)
+        keep = np.where(twin | (POPCOUNT_TABLE[units] == 1), full, ~twins[:, :, None]).astype(np.uint16)
+        cands = cands & np.bitwise_and.reduce(_per_cell(keep.reshape(n, -1), arrays.cell_slots, full), axis=2)
+
+    units = cands[:, arrays.unit_cells]
+    single_u = POPCOUNT_TABLE[units] == 1
+    assigned = np.bitwise_or.reduce(np.where(single_u, units, 0), axis=2)
+    repeated = single_u.sum(axis=2) != POPCOUNT_TABLE[assigned]
+    missing = np.bitwise_or.reduce(units, axis=2) != full
+    dead = (cands == 0).any(axis=1) | repeated.any(axis=1) | missing.any(axis=1)
+    return cands, dead
+
+
+def propagate(cands: np.ndarray, index: UnitIndex = NOT_DIAGONAL_INDEX, pairs=True,
+              max_rounds=81) -> Tuple[np.ndarray, np.ndarray]:
+    """Propagates every puzzle until none of them changes, returns the candidates and the dead puzzles.
+       Puzzles stop taking part in the rounds as soon as they are stable or dead"""
+    arrays = unit_arrays(index)
+    cands = cands.copy()
+    dead = np.zeros(cands.shape[0], dtype=bool)
+    active = np.arange(cands.shape[0])
+    for _ in range(max_rounds):
+        if not active.size:
+            break
+        new, new_dead = propagate_round(cands[active], arrays, pairs)
+        changed = (new != cands[active]).any(axis=1)
+        cands[active] = new
+        dead[active] = new_dead
+        active = active[changed & ~new_dead]
+    return cands, dead
+
+
+def solve_many(grids: Sequence[str], use_diagonal=False, pairs=True) -> List[Optional[str]]:
+    """
+    Solve many puzzles at once: all of them are propagated together as an (N, 81) array and only the
+    puzzles left with undecided boxes go to the scalar search.
+    Args:
+        grids: grid strings, '.' or '0' for empty boxes
+        use_diagonal: If true it will enforce a diagonal sudoku
+        pairs: If true apply naked pairs in the vectorized rounds
+    Returns:
+        The solution of every grid in order, None for the ones without a solution
+    """
+    if not grids:
+        return []
+    index, units = (ALL_INDEX, ALL_UNITS) if use_diagonal else (NOT_DIAGONAL_INDEX, NOT_DIAGONAL_UNITS)
+    cands, dead = propagate(encode(grids), index, pairs)
+    solved = (POPCOUNT_TABLE[cands] == 1).all(axis=1) & ~dead
+    strings = decode(cands)
+    results: List[Optional[str]] = [None] * len(grids)
+    for i in np.flatnonzero(solved):
+        results[i] = strings[i]
+    for i in np.flatnonzero(~solved & ~dead):
+        cells = array(CELL_TYPE)
+        cells.frombytes(cands[i].astype(np.uint16).tobytes())
+        game = search_in_place(Sudoku(cells, units=units))
+        results[i] = str(game) if game and game.is_solved() else None
+    return results
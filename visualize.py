@@ -1,7 +1,7 @@
 from PySudoku import play
 
-def visualize_assignments(assignments):
-    """ Visualizes the set of assignments created by the Sudoku AI"""
+def filter_assignments(assignments):
+    """ The assignments that assign at least one new box"""
     last_assignment = None
     filtered_assignments = []
 
@@ -14,4 +14,15 @@ def visualize_assignments(assignments):
                 filtered_assignments.append(assignments[i])
         last_assignment = assignments[i]
 
-    play(filtered_assignments)
+    return filtered_assignments
+
+
+def visualize_assignments(assignments):
+    """ Visualizes the set of assignments created by the Sudoku AI"""
+    play(filter_assignments(assignments))
+
+
+def render_assignments(assignments, directory, animation=None, fps=5):
+    """ Renders the set of assignments headless to PNG frames in directory and optionally an animated GIF"""
+    from replay import render_replay
+    return render_replay(filter_assignments(assignments), directory, animation, fps)
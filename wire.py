@@ -0,0 +1,102 @@
+from array import array
+from enum import Enum
+from typing import Iterable, Iterator, List, Tuple, Union
+
+from bitboard import Cells, MaskTables, mask_tables
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# every encoding starts with the form and the box size n of its boards, then holds fixed size records:
+#   MASKS: the candidate mask of every box, len(digits) bits each (92 bytes for 9x9)
+#   GIVENS: the assigned value of every box as its 1-based index, 0 when undecided (41 bytes for 9x9)
+# bits are packed little endian, the first box in the lowest bits of the first byte
+HEADER_SIZE = 2
+
+
+class WireForm(Enum):
+    MASKS = 1
+    GIVENS = 2
+
+
+def value_bits(form: WireForm, tables: MaskTables) -> int:
+    """Bits used by every box in a record of that form"""
+    size = len(tables.digits)
+    return size if form == WireForm.MASKS else size.bit_length()
+
+
+def record_size(form: WireForm, tables: MaskTables) -> int:
+    return (len(tables.boxes) * value_bits(form, tables) + 7) // 8
+
+
+def encode_cells(cells: Cells, form: WireForm, tables: MaskTables) -> bytes:
+    """One record, without header"""
+    bits = value_bits(form, tables)
+    packed = 0
+    if form == WireForm.MASKS:
+        for m in reversed(cells):
+            packed = (packed << bits) | m
+    else:
+        popcount = tables.popcount
+        for m in reversed(cells):
+            packed = (packed << bits) | (m.bit_length() if popcount[m] == 1 else 0)
+    return packed.to_bytes(record_size(form, tables), 'little')
+
+
+def decode_cells(record: Buffer, form: WireForm, tables: MaskTables) -> Cells:
+    """The candidate buffer of one record, without header"""
+    bits = value_bits(form, tables)
+    packed = int.from_bytes(record, 'little')
+    low = (1 << bits) - 1
+    values = [(packed >> shift) & low for shift in range(0, len(tables.boxes) * bits, bits)]
+    if form == WireForm.GIVENS:
+        full = tables.full_mask
+        values = [1 << (v - 1) if v else full for v in values]
+    return array(tables.cell_type, values)
+
+
+def encode_many(boards: Iterable[Cells], form: WireForm = WireForm.MASKS, n=3) -> bytes:
+    """The header and a record for every candidate buffer, all of boxes n*n by n*n"""
+    tables = mask_tables(n)
+    return bytes((form.value, n)) + b''.join(encode_cells(cells, form, tables) for cells in boards)
+
+
+def decode_many(data: Buffer) -> List[Cells]:
+    """The candidate buffers of an encoding made by encode_many"""
+    return list(BoardView(data))
+
+
+def read_header(data: Buffer) -> Tuple[WireForm, MaskTables]:
+    if len(data) < HEADER_SIZE:
+        raise ValueError('a board encoding needs at least %d bytes' % HEADER_SIZE)
+    return WireForm(data[0]), mask_tables(data[1])
+
+
+class BoardView(object):
+    """
+    Boards of an encoding read in place from any buffer (bytes, bytearray, memoryview, mmap): nothing is
+    copied when the view is made, view.record(i) is a memoryview of the i-th record and view[i] decodes it
+    to a candidate buffer on demand.
+    """
+    def __init__(self, data: Buffer):
+        self.form, self.tables = read_header(data)
+        self.data = memoryview(data)[HEADER_SIZE:]
+        self.record_size = record_size(self.form, self.tables)
+        if len(self.data) % self.record_size:
+            raise ValueError('%d bytes is not a whole number of %d byte records' %
+                             (len(self.data), self.record_size))
+
+    def __len__(self):
+        return len(self.data) // self.record_size
+
+    def record(self, i: int) -> memoryview:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.data[i * self.record_size:(i + 1) * self.record_size]
+
+    def __getitem__(self, i: int) -> Cells:
+        return decode_cells(self.record(i), self.form, self.tables)
+
+    def __iter__(self) -> Iterator[Cells]:
+        return (self[i] for i in range(len(self)))